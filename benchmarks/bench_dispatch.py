@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# compares the per-command latency of CommandDispatcher against parsing every command with argparse,
+# and checks that both produce the same namespaces, or the same exit for the lines left to argparse.
+#
+# usage: python benchmarks/bench_dispatch.py [REPEAT]
+
+import contextlib
+import datetime
+import io
+import os
+import sys
+import time
+import types
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+# the benchmark runs offline
+sys.modules.setdefault("wechat_file_helper", types.SimpleNamespace(send=lambda messages: None))
+
+import schedule_managing as sm
+
+COMMANDS = [
+    "a -s 0900 -d 30 -t write the report",
+    "add-a-task -s 0900 -e 1030 -t meeting -r",
+    "a -d 1h30 -t read -r 15",
+    "a -t take a walk",
+    "m -i 3 -s 1000 -d 45",
+    "modify -i 0 -t new name",
+    "m -i 2 -s 0930 -e 1000 -t renamed task",
+    "d -i 1",
+    "delete --task-index 4",
+    "-s",
+    "-S",
+    "-p",
+    "-R",
+    "-R 2020-01-01",
+    "-q",
+    "-w 2",
+    "Q -t gym -f 2020-01-01 -u 2020-12-31",
+    "query -F 1400 -d 1h00",
+]
+
+# lines the dispatcher leaves to argparse
+FALLBACK_COMMANDS = [
+    "export",
+    "export -f 2020-01-01",
+    "export all.csv -f 2020-01-01 -u 2020-12-31",
+    "import",
+    "import all.ics",
+    "a -t",
+    "m -i x -t name",
+]
+
+
+def make_schedule():
+    schedule = sm.Schedule(date=datetime.date(2000, 1, 1))
+    start = datetime.datetime(2000, 1, 1, 8)
+    for i in range(10):
+        schedule.task_list.append(sm.Task(sm.TimeSlice(start, datetime.timedelta(minutes=30)), f"task {i}"))
+        start += datetime.timedelta(minutes=30)
+
+    return schedule
+
+
+def outcome(parse, command):
+    # the namespace of the line, or the exit code if it is invalid
+    try:
+        with contextlib.redirect_stderr(io.StringIO()):
+            return parse(command.split())
+    except SystemExit as e:
+        return e.code
+
+
+def bench(parse, commands, repeat):
+    begin = time.perf_counter()
+    for _ in range(repeat):
+        for command in commands:
+            parse(command.split())
+
+    return (time.perf_counter() - begin) / (repeat * len(commands))
+
+
+if __name__ == '__main__':
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    sm.current_schedule.set(make_schedule())
+    parser = sm.build_parser()
+    dispatcher = sm.CommandDispatcher(parser)
+
+    for command in COMMANDS:
+        assert dispatcher._parse(command.split()) is not None, command
+        assert dispatcher.parse_args(command.split()) == parser.parse_args(command.split()), command
+    for command in FALLBACK_COMMANDS:
+        assert dispatcher._parse(command.split()) is None, command
+        assert outcome(dispatcher.parse_args, command) == outcome(parser.parse_args, command), command
+
+    argparse_latency = bench(parser.parse_args, COMMANDS, repeat)
+    dispatcher_latency = bench(dispatcher.parse_args, COMMANDS, repeat)
+
+    print(f"{len(COMMANDS)} commands, {repeat} times")
+    print(f"argparse:   {argparse_latency * 1e6:.1f}us per command")
+    print(f"dispatcher: {dispatcher_latency * 1e6:.1f}us per command")
+    print(f"speedup:    {argparse_latency / dispatcher_latency:.1f}x")
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# measures the memory held by archives of tasks with the slotted TimeSlice and Task
+# against the dict based classes used before.
+#
+# usage: python benchmarks/bench_memory.py [TASK_NUM]
+
+import datetime
+import os
+import sys
+import tracemalloc
+import types
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+# the benchmark runs offline
+sys.modules.setdefault("wechat_file_helper", types.SimpleNamespace(send=lambda messages: None))
+
+import schedule_managing as sm
+
+
+class DictTimeSlice:
+    def __init__(self, start=None, duration=None, end=None):
+        self.start = start
+        self.duration = duration
+        self.end = end
+
+
+class DictTask:
+    def __init__(self, time_slice=None, name=''):
+        self.time_slice = time_slice
+        self.name = name
+
+
+NAMES = ["work", "take a rest", "gym", "read", "lunch", "meeting", "project a", "project b"]
+
+
+def make_archive(task_num, time_slice_cls, task_cls):
+    task_list = []
+    date = datetime.datetime(2000, 1, 1)
+    for i in range(task_num):
+        # 30 tasks of 30 minutes a day
+        if i % 30 == 0:
+            date += datetime.timedelta(days=1)
+        start = date + datetime.timedelta(minutes=30 * (i % 30))
+        duration = datetime.timedelta(minutes=30)
+        # names are read from files, so each one is a new str obj
+        name = ''.join(NAMES[i % len(NAMES)])
+        task_list.append(task_cls(time_slice_cls(start, duration, start + duration), name))
+
+    return task_list
+
+
+def measure(task_num, time_slice_cls, task_cls):
+    tracemalloc.start()
+    task_list = make_archive(task_num, time_slice_cls, task_cls)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del task_list
+
+    return current, peak
+
+
+if __name__ == '__main__':
+    task_num = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    dict_current, dict_peak = measure(task_num, DictTimeSlice, DictTask)
+    slots_current, slots_peak = measure(task_num, sm.TimeSlice, sm.Task)
+
+    print(f"{task_num} tasks")
+    print(f"dict:  {dict_current / 2 ** 20:.1f}MiB ({dict_current / task_num:.0f}B per task), "
+          f"peak {dict_peak / 2 ** 20:.1f}MiB")
+    print(f"slots: {slots_current / 2 ** 20:.1f}MiB ({slots_current / task_num:.0f}B per task), "
+          f"peak {slots_peak / 2 ** 20:.1f}MiB")
+    print(f"saved: {(1 - slots_current / dict_current) * 100:.0f}%")
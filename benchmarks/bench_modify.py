@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# compares the cost of shifting the tasks after a modified task with the lazy offset tree
+# against the loop which adds the time delta to every following task.
+# checks first that modifying, undoing and redoing tasks in groups of a txt moves the same tasks as the loop,
+# and that the free time slices kept up to date by adding, deleting and undoing tasks equal ones built again.
+#
+# usage: python benchmarks/bench_modify.py [TASK_NUM] [EDIT_NUM]
+
+import contextlib
+import datetime
+import io
+import os
+import random
+import sys
+import time
+import types
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+# the benchmark runs offline
+sys.modules.setdefault("wechat_file_helper", types.SimpleNamespace(send=lambda messages: None))
+
+import schedule_managing as sm
+
+
+def make_schedule(task_num):
+    date = datetime.date(2000, 1, 1)
+    schedule = sm.Schedule(date=date)
+    start = datetime.datetime(2000, 1, 1)
+    for i in range(task_num):
+        time_slice = sm.TimeSlice(start, datetime.timedelta(seconds=5), start + datetime.timedelta(seconds=5))
+        schedule.task_list.append(sm.Task(time_slice, f"task {i}"))
+        start += datetime.timedelta(seconds=5)
+
+    # only the cost of the modification is measured
+    schedule.display_schedule = lambda window=None: None
+
+    return schedule
+
+
+def loop_shift(schedule, task_index, time_delta):
+    # the shift loop modify_a_task() used before the offset tree
+    for i in range(task_index + 1, len(schedule.task_list)):
+        time_slice = schedule.task_list[i].time_slice
+
+        time_slice.start += time_delta
+        time_slice.end += time_delta
+
+
+def check_groups(task_num=300, edit_num=100, seed=0):
+    rng = random.Random(seed)
+    lines = []
+    minute = 0
+    for i in range(task_num):
+        if i and rng.random() < 0.4:
+            lines.append(f"({i})     task {i}")
+        else:
+            lines.append(f"({i}) {minute // 60:02}:{minute % 60:02}-{(minute + 2) // 60:02}:{(minute + 2) % 60:02} "
+                         f"00h 02min: task {i}")
+            minute += 2
+
+    schedule = sm.Schedule(task_list=list(sm.parse_schedule(lines, datetime.date(2000, 1, 1))),
+                           date=datetime.date(2000, 1, 1))
+    schedule.display_schedule = lambda window=None: None
+    expected = [(task.time_slice.start, task.time_slice.end) for task in schedule.task_list]
+    original = expected[:]
+
+    for _ in range(edit_num):
+        task_index = rng.randrange(1, task_num)
+        start, end = expected[task_index]
+        time_delta = datetime.timedelta(minutes=rng.randrange(2, 5))
+        schedule.modify_a_task(task_index, start + time_delta, end - start, None, None)
+        expected[task_index:] = [(start + time_delta, end + time_delta) for start, end in expected[task_index:]]
+        schedule._apply_offsets()
+        assert [(task.time_slice.start, task.time_slice.end) for task in schedule.task_list] == expected
+
+    for _ in range(edit_num):
+        schedule.undo()
+    schedule._apply_offsets()
+    assert [(task.time_slice.start, task.time_slice.end) for task in schedule.task_list] == original
+
+    for _ in range(edit_num):
+        schedule.redo()
+    schedule._apply_offsets()
+    assert [(task.time_slice.start, task.time_slice.end) for task in schedule.task_list] == expected
+
+
+def check_gaps(task_num=200, edit_num=300, seed=0):
+    rng = random.Random(seed)
+    lines = []
+    minute = 0
+    for i in range(task_num):
+        if i and rng.random() < 0.2:
+            lines.append(f"({i})     task {i}")
+        else:
+            minute += rng.randrange(0, 4)
+            lines.append(f"({i}) {minute // 60:02}:{minute % 60:02}-{(minute + 2) // 60:02}:{(minute + 2) % 60:02} "
+                         f"00h 02min: task {i}")
+            minute += 2
+
+    date = datetime.date(2000, 1, 1)
+    midnight = datetime.datetime(2000, 1, 1)
+    schedule = sm.Schedule(task_list=list(sm.parse_schedule(lines, date)), date=date)
+    schedule.display_schedule = lambda window=None: None
+
+    for _ in range(edit_num):
+        action = rng.random()
+        try:
+            # the errors of conflicting tasks and of nothing to undo are expected
+            with contextlib.redirect_stdout(io.StringIO()):
+                if action < 0.4:
+                    start = midnight + datetime.timedelta(minutes=rng.randrange(0, 24 * 60))
+                    duration = datetime.timedelta(minutes=rng.randrange(1, 6))
+                    schedule.add_a_task(start, duration, None, "task", None, auto=rng.random() < 0.5)
+                elif action < 0.7 and schedule.task_list:
+                    schedule.delete_a_task(rng.randrange(len(schedule.task_list)))
+                elif action < 0.8 and len(schedule.task_list) > 1:
+                    task_index = rng.randrange(1, len(schedule.task_list))
+                    time_slice = schedule.task_list[task_index].time_slice
+                    start = time_slice.start + schedule._offset(task_index) + datetime.timedelta(minutes=1)
+                    schedule.modify_a_task(task_index, start, time_slice.duration, None, None)
+                elif action < 0.9:
+                    schedule.undo()
+                else:
+                    schedule.redo()
+        except Exception:
+            pass
+
+        after = midnight + datetime.timedelta(minutes=rng.randrange(0, 24 * 60))
+        durations = [datetime.timedelta(minutes=rng.randrange(1, 30)) for _ in range(3)]
+        kept = [schedule.find_free_slot(duration, after) for duration in durations]
+        schedule._gaps = None
+        assert kept == [schedule.find_free_slot(duration, after) for duration in durations]
+
+
+def bench(task_num, edit_num):
+    random.seed(0)
+    indices = [random.randrange(1, task_num) for _ in range(edit_num)]
+
+    schedule = make_schedule(task_num)
+    begin = time.perf_counter()
+    for task_index in indices:
+        time_slice = schedule.task_list[task_index].time_slice
+        start = time_slice.start + schedule._offset(task_index) + datetime.timedelta(seconds=1)
+        schedule.modify_a_task(task_index, start, time_slice.duration, None, None)
+    schedule._apply_offsets()
+    lazy = time.perf_counter() - begin
+    lazy_result = [(task.time_slice.start, task.time_slice.end) for task in schedule.task_list]
+
+    schedule = make_schedule(task_num)
+    begin = time.perf_counter()
+    for task_index in indices:
+        time_slice = schedule.task_list[task_index].time_slice
+        time_slice.start += datetime.timedelta(seconds=1)
+        time_slice.end += datetime.timedelta(seconds=1)
+        loop_shift(schedule, task_index, datetime.timedelta(seconds=1))
+    loop = time.perf_counter() - begin
+    loop_result = [(task.time_slice.start, task.time_slice.end) for task in schedule.task_list]
+
+    assert lazy_result == loop_result
+
+    return lazy, loop
+
+
+if __name__ == '__main__':
+    task_num = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    edit_num = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+
+    for seed in range(20):
+        check_groups(seed=seed)
+        check_gaps(seed=seed)
+    lazy, loop = bench(task_num, edit_num)
+    print(f"{task_num} tasks, {edit_num} edits")
+    print(f"offset tree: {lazy * 1000:.1f}ms")
+    print(f"loop:        {loop * 1000:.1f}ms")
+    print(f"speedup:     {loop / lazy:.1f}x")
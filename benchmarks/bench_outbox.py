@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# compares how long the REPL waits for sending schedules inline and through the outbox,
+# with a local transport simulating the latency of the network,
+# and how long closing the outbox waits for the queued messages.
+#
+# usage: python benchmarks/bench_outbox.py [SEND_NUM] [LATENCY_SECONDS]
+
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import schedule_managing as sm
+
+
+def make_schedule():
+    schedule = sm.Schedule(date=datetime.date(2000, 1, 1))
+    start = datetime.datetime(2000, 1, 1, 8)
+    for i in range(20):
+        schedule.task_list.append(sm.Task(sm.TimeSlice(start, datetime.timedelta(minutes=30)), f"task {i}"))
+        start += datetime.timedelta(minutes=30)
+    schedule._schedule_format()
+
+    return schedule
+
+
+def bench(send_num, latency):
+    schedule = make_schedule()
+
+    with tempfile.TemporaryDirectory() as directory:
+        transport = sm.LocalTransport(os.path.join(directory, "inline.txt"), delay=latency)
+        begin = time.perf_counter()
+        for _ in range(send_num):
+            transport.send([schedule.schedule_str])
+        inline = time.perf_counter() - begin
+
+        transport = sm.LocalTransport(os.path.join(directory, "outbox.txt"), delay=latency)
+        outbox = sm.Outbox(transport, os.path.join(directory, "outbox.json"))
+        begin = time.perf_counter()
+        for _ in range(send_num):
+            schedule.send_to_wechat(outbox)
+        queued = time.perf_counter() - begin
+        begin = time.perf_counter()
+        outbox.close()
+        closing = time.perf_counter() - begin
+
+        with open(os.path.join(directory, "outbox.txt")) as f:
+            sent_num = f.read().count("(19)")
+
+    return inline, queued, closing, sent_num
+
+
+if __name__ == '__main__':
+    send_num = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+
+    inline, queued, closing, sent_num = bench(send_num, latency)
+    print(f"{send_num} sends of the same schedule, {latency * 1000:.0f}ms latency")
+    print(f"inline: {inline * 1000 / send_num:.2f}ms per send")
+    print(f"outbox: {queued * 1000 / send_num:.2f}ms per send, {sent_num} messages sent after coalescing")
+    print(f"close:  {closing * 1000:.2f}ms")
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# load-tests the server: starts it on a unix socket in a temp dir, connects clients sending commands
+# to schedules of a few dates shared by them, and reports the throughput and the latency of the commands.
+#
+# usage: python benchmarks/bench_server.py [CLIENT_NUM] [COMMAND_NUM] [DATE_NUM]
+
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "schedule_managing.py")
+
+COMMANDS = ["a -d 5 -t load", "m -i 0 -t renamed", "d -i 1"]
+
+
+async def request(reader, writer, line):
+    writer.write(f"{line}\n".encode())
+    await writer.drain()
+    while True:
+        response = await reader.readline()
+        if response in (b".\n", b""):
+            return
+
+
+async def client(path, date, command_num, latencies):
+    reader, writer = await asyncio.open_unix_connection(path)
+    await request(reader, writer, f"-R {date}")
+    await request(reader, writer, "-w 0")
+    for i in range(command_num):
+        begin = time.perf_counter()
+        await request(reader, writer, COMMANDS[i % len(COMMANDS)])
+        latencies.append(time.perf_counter() - begin)
+    await request(reader, writer, "-q")
+    writer.close()
+
+
+async def load(path, client_num, command_num, dates):
+    latencies = []
+    begin = time.perf_counter()
+    await asyncio.gather(*(client(path, dates[i % len(dates)], command_num, latencies) for i in range(client_num)))
+
+    return time.perf_counter() - begin, sorted(latencies)
+
+
+def main():
+    client_num = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    command_num = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    date_num = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.mkdir(os.path.join(directory, "schedule"))
+        dates = [f"2000-01-{day:02}" for day in range(1, date_num + 1)]
+        for date in dates:
+            with open(os.path.join(directory, "schedule", f"{date}.txt"), 'w') as f:
+                f.write("(0) 08:00-08:30 00h 30min: base\n")
+
+        path = os.path.join(directory, "server.sock")
+        server = subprocess.Popen([sys.executable, SCRIPT, "--serve", path, "--transport", "local"],
+                                  cwd=directory, stdout=subprocess.PIPE, text=True)
+        try:
+            server.stdout.readline()  # serving on ...
+            elapsed, latencies = asyncio.run(load(path, client_num, command_num, dates))
+        finally:
+            server.send_signal(signal.SIGINT)
+            server.wait()
+
+    print(f"{client_num} clients, {command_num} commands each, {date_num} dates")
+    print(f"throughput: {len(latencies) / elapsed:.0f} commands/s")
+    print(f"p50:        {latencies[len(latencies) // 2] * 1000:.2f}ms")
+    print(f"p99:        {latencies[int(len(latencies) * 0.99)] * 1000:.2f}ms")
+
+
+if __name__ == '__main__':
+    main()
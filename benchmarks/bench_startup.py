@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# measures the time from launching the REPL to its first prompt: for a new schedule,
+# and for resuming a schedule of TASK_NUM tasks from its snapshot and from its txt with --resume/-c.
+# the first prompt is taken as the first line printed, which is the schedule when resuming,
+# or the output of the first command sent right away otherwise.
+#
+# usage: python benchmarks/bench_startup.py [TASK_NUM] [REPEAT]
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import schedule_managing as sm
+from run import DATE, make_schedule_str
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "schedule_managing.py")
+
+
+def first_prompt(directory, args, input_):
+    # seconds until the first line is printed
+    begin = time.perf_counter()
+    process = subprocess.Popen([sys.executable, SCRIPT, "-r", "--transport", "local"] + args, cwd=directory,
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    process.stdin.write(input_)
+    process.stdin.flush()
+    process.stdout.readline()
+    elapsed = time.perf_counter() - begin
+    process.communicate()
+
+    return elapsed
+
+
+def best(func, repeat):
+    return min(func() for _ in range(repeat))
+
+
+def main():
+    task_num = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.mkdir(os.path.join(directory, "schedule"))
+        path = os.path.join("schedule", f"{DATE.isoformat()}.txt")
+        with open(os.path.join(directory, path), 'w') as f:
+            f.write(make_schedule_str(task_num))
+
+        def interpreter():
+            begin = time.perf_counter()
+            subprocess.run([sys.executable, "-c", "pass"])
+            return time.perf_counter() - begin
+
+        def new():
+            return first_prompt(directory, [], "a -s 0900 -d 30 -t foo\n-p\n-q\nn\n")
+
+        def from_snapshot():
+            # the schedule is saved, so its tasks are kept in the snapshot at the exit
+            return first_prompt(directory, ["-c"], "-q\n")
+
+        def from_txt():
+            # a snapshot of an unsaved schedule keeps only its path
+            cwd = os.getcwd()
+            os.chdir(directory)
+            try:
+                schedule = sm.Schedule(date=DATE)
+                schedule.path = path
+                sm.save_snapshot(schedule)
+            finally:
+                os.chdir(cwd)
+            return first_prompt(directory, ["-c"], "-q\n")
+
+        results = {
+            "python -c pass": best(interpreter, repeat),
+            "new schedule": best(new, repeat),
+        }
+        # quitting a new schedule without saving it leaves a snapshot of nothing to resume, so it's taken after
+        first_prompt(directory, ["-R", DATE.isoformat()], f"-R {DATE.isoformat()}\n-q\n")
+        results |= {
+            f"resume {task_num} tasks from the snapshot": best(from_snapshot, repeat),
+            f"resume {task_num} tasks from the txt": best(from_txt, repeat),
+        }
+
+    for name, elapsed in results.items():
+        print(f"{name}: {elapsed * 1000:.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
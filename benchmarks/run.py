@@ -0,0 +1,306 @@
+#!/usr/bin/env python
+# benchmark suite of the hot paths of schedule_managing:
+# Schedule._task_append, modify_a_task, _schedule_format, read_from_txt, save_to_txt and solve_backlog,
+# and indexing and reporting multi-year archives.
+#
+# results are written as json ({case: seconds}) and compared with a baseline if given.
+# exits with 1 if a case is slower than the baseline by more than the tolerance.
+#
+# usage: python benchmarks/run.py [--sizes 10,100,1000] [--years 3] [--output FILE] [--baseline FILE]
+#                                 [--tolerance 0.25] [--filter SUBSTR]
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import types
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+# the benchmark runs offline
+sys.modules.setdefault("wechat_file_helper", types.SimpleNamespace(send=lambda messages: None))
+
+import schedule_managing as sm
+
+# only the cost of the modifications is measured, so the schedules are not displayed after them
+sm.display_settings.set(sm.DisplaySettings(auto=False))
+
+DATE = datetime.date(2000, 1, 1)
+MIDNIGHT = datetime.datetime(2000, 1, 1)
+DAY = datetime.timedelta(days=1)
+NAMES = ["work", "take a rest", "gym", "read", "lunch", "meeting", "project a", "project b"]
+
+
+def make_tasks(task_num, overlap, seed=0):
+    # tasks in random order, each in its own slot of the day.
+    # a share of `overlap` of them either share the time slice of another task (half of them)
+    # or overlap another task (the other half)
+    rng = random.Random(seed)
+    slot = DAY / task_num
+    time_slices = [sm.TimeSlice(MIDNIGHT + slot * i, None, MIDNIGHT + slot * i + slot / 2) for i in range(task_num)]
+
+    tasks = []
+    for i in range(task_num):
+        time_slice = time_slices[i]
+        if rng.random() < overlap:
+            other = time_slices[rng.randrange(task_num)]
+            if rng.random() < 0.5:
+                time_slice = sm.TimeSlice(other.start, None, other.end)
+            else:
+                time_slice = sm.TimeSlice(other.start + slot / 4, None, other.end + slot / 4)
+        tasks.append(sm.Task(time_slice, NAMES[i % len(NAMES)]))
+    rng.shuffle(tasks)
+
+    return tasks
+
+
+def make_schedule(task_num):
+    # a valid schedule with the tasks back to back
+    schedule = sm.Schedule(date=DATE)
+    slot = DAY / task_num
+    for i in range(task_num):
+        schedule.task_list.append(sm.Task(sm.TimeSlice(MIDNIGHT + slot * i, None, MIDNIGHT + slot * (i + 1)),
+                                          NAMES[i % len(NAMES)]))
+
+    return schedule
+
+
+def make_schedule_str(task_num, group=0.2, seed=0):
+    # rows of a schedule txt, a share of `group` of them sharing the time slice of the row above
+    rng = random.Random(seed)
+    rows = []
+    minute = 0
+    for i in range(task_num):
+        if i and rng.random() < group:
+            rows.append(f"({i}) {' '.ljust(26 - len(str(i)) - 2)}{NAMES[i % len(NAMES)]}\n")
+            continue
+
+        start, end = minute % 1440, (minute + 1) % 1440
+        minute += 1
+        rows.append(f"({i}) {str(start // 60).zfill(2)}:{str(start % 60).zfill(2)}-"
+                    f"{str(end // 60).zfill(2)}:{str(end % 60).zfill(2)} 00h 01min: {NAMES[i % len(NAMES)]}\n")
+
+    return ''.join(rows)
+
+
+def make_archive(directory, years, task_num=30):
+    # day txts of `years` years with task_num tasks each
+    schedule_str = make_schedule_str(task_num, group=0.1)
+    for day in range(365 * years):
+        date = DATE + datetime.timedelta(days=day)
+        with open(os.path.join(directory, f"{date.isoformat()}.txt"), 'w') as f:
+            f.write(schedule_str)
+
+
+def measure(func, setup=None, min_time=0.2, max_repeat=5):
+    # the best time of func() out of up to max_repeat runs. setup() is run before every run and not measured
+    best = None
+    total = 0
+    for _ in range(max_repeat):
+        state = setup() if setup else None
+        begin = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            func(state) if setup else func()
+        elapsed = time.perf_counter() - begin
+
+        best = elapsed if best is None else min(best, elapsed)
+        total += elapsed
+        if total > min_time:
+            break
+
+    return best
+
+
+def bench_task_append(task_num, overlap):
+    tasks = make_tasks(task_num, overlap)
+
+    def append(schedule):
+        for task in tasks:
+            try:
+                schedule._task_append(task)
+            except Exception:
+                pass
+
+    return measure(append, lambda: sm.Schedule(date=DATE))
+
+
+def bench_modify_a_task(task_num, edit_num=1000):
+    rng = random.Random(0)
+    edits = [rng.randrange(1, task_num) for _ in range(edit_num)] if task_num > 1 else []
+
+    def modify(schedule):
+        for task_index in edits:
+            time_slice = schedule.task_list[task_index].time_slice
+            start = time_slice.start + schedule._offset(task_index)
+            # moves the task and the following ones later, so that it never conflicts with the preceding one
+            schedule.modify_a_task(task_index, start + time_slice.duration / 100, time_slice.duration, None, None)
+        schedule._apply_offsets()
+
+    return measure(modify, lambda: make_schedule(task_num))
+
+
+def bench_schedule_format(task_num, warm):
+    def setup():
+        schedule = make_schedule(task_num)
+        if warm:
+            schedule._schedule_format()
+            schedule.task_list[task_num // 2].name = "renamed"
+            schedule._mark_dirty(task_num // 2, shifted=False)
+
+        return schedule
+
+    return measure(lambda schedule: schedule._schedule_format(), setup)
+
+
+def bench_read_from_txt(directory, task_num):
+    path = os.path.join(directory, f"read-{task_num}.txt")
+    with open(path, 'w') as f:
+        f.write(make_schedule_str(task_num))
+
+    return measure(lambda: sm.load_schedule(path, DATE))
+
+
+def bench_save_to_txt(directory, task_num):
+    def setup():
+        schedule = make_schedule(task_num)
+        schedule.path = os.path.join(directory, f"{DATE.isoformat()}.txt")
+
+        return schedule
+
+    return measure(lambda schedule: schedule.save_to_txt(override=True), setup)
+
+
+def bench_solve_backlog(task_num, day_num=30):
+    # packs task_num tasks with random durations, priorities and earliest starts into day_num days
+    # which are half busy
+    rng = random.Random(0)
+    busy = [[(start, start + 30) for start in range(0, 24 * 60, 60)] for _ in range(day_num)]
+    backlog = [(f"task {i}", rng.choice([15, 30, 45]), rng.randint(0, 3),
+                rng.randrange(day_num * 24 * 60), sys.maxsize) for i in range(task_num)]
+
+    return measure(lambda: sm.solve_backlog(backlog, busy))
+
+
+def bench_archive(directory, years, case_filter=None):
+    archive_dir = os.path.join(directory, f"archive-{years}")
+
+    def remove_index():
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(os.path.join(archive_dir, ".index.sqlite3"))
+
+    def report(directory):
+        # refreshes the index and sums the time spent on every task by month, like report_archive()
+        archive = sm.ArchiveIndex(directory)
+        archive.refresh()
+        list(archive.report("month"))
+
+    def load_all():
+        for entry in os.scandir(archive_dir):
+            if sm.date_file_pat.search(entry.name):
+                sm.load_schedule(entry.path)
+
+    cases = {
+        f"archive_load_all/years={years}": lambda: measure(load_all),
+        f"archive_refresh_cold/years={years}": lambda: measure(lambda state: sm.ArchiveIndex(archive_dir).refresh(),
+                                                               remove_index, max_repeat=2),
+        f"archive_refresh_warm/years={years}": lambda: measure(lambda: sm.ArchiveIndex(archive_dir).refresh()),
+        f"archive_report_warm/years={years}": lambda: measure(lambda: report(archive_dir)),
+    }
+    cases = {name: case for name, case in cases.items() if not case_filter or case_filter in name}
+    if cases:
+        os.mkdir(archive_dir)
+        make_archive(archive_dir, years)
+
+    return {name: case() for name, case in cases.items()}
+
+
+def run(sizes, years, case_filter=None):
+    results = {}
+
+    def record(name, func, *args):
+        if case_filter and case_filter not in name:
+            return
+        results[name] = func(*args)
+        print(f"{name}: {results[name] * 1000:.2f}ms", file=sys.stderr)
+
+    with tempfile.TemporaryDirectory() as directory:
+        for task_num in sizes:
+            for overlap in (0, 0.1, 0.5):
+                record(f"task_append/n={task_num}/overlap={overlap}", bench_task_append, task_num, overlap)
+            record(f"modify_a_task/n={task_num}", bench_modify_a_task, task_num)
+            record(f"schedule_format_cold/n={task_num}", bench_schedule_format, task_num, False)
+            record(f"schedule_format_warm/n={task_num}", bench_schedule_format, task_num, True)
+            record(f"read_from_txt/n={task_num}", bench_read_from_txt, directory, task_num)
+            record(f"save_to_txt/n={task_num}", bench_save_to_txt, directory, task_num)
+            record(f"solve_backlog/n={task_num}", bench_solve_backlog, task_num)
+
+        for year_num in years:
+            for name, elapsed in bench_archive(directory, year_num, case_filter).items():
+                results[name] = elapsed
+                print(f"{name}: {elapsed * 1000:.2f}ms", file=sys.stderr)
+
+    return results
+
+
+def compare(results, baseline, tolerance):
+    # prints the ratio of every case to the baseline, returns the names of the slower cases
+    slower = []
+    for name, elapsed in results.items():
+        if name not in baseline:
+            continue
+
+        ratio = elapsed / baseline[name]
+        if ratio > 1 + tolerance:
+            slower.append(name)
+            mark = "slower"
+        elif ratio < 1 - tolerance:
+            mark = "faster"
+        else:
+            mark = ""
+        print(f"{name}: {baseline[name] * 1000:.2f}ms -> {elapsed * 1000:.2f}ms ({ratio:.2f}x) {mark}")
+
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark suite of schedule_managing")
+    parser.add_argument("--sizes", default="10,100,1000,10000,100000",
+                        help="numbers of tasks of a schedule, separated by commas")
+    parser.add_argument("--years", default="1,3",
+                        help="numbers of years of the archives, separated by commas")
+    parser.add_argument("--filter", help="run the cases whose names contain the str only")
+    parser.add_argument("--output", help="write the results to a json")
+    parser.add_argument("--baseline", help="compare the results with a json written by --output")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="ratio to the baseline regarded as a change (0.25 by default)")
+    args = parser.parse_args()
+
+    results = run([int(size) for size in args.sizes.split(',')], [int(year) for year in args.years.split(',')],
+                  args.filter)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "time": datetime.datetime.now().isoformat(timespec="seconds"),
+                "results": results,
+            }, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        slower = compare(results, baseline, args.tolerance)
+        if slower:
+            print(f"{len(slower)} cases are slower than the baseline")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
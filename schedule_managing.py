@@ -2,32 +2,289 @@
 
 import datetime
 import argparse
-import traceback
-import copy
+import bisect
+import collections
+import heapq
+import itertools
 import re
 import os
-
-from wechat_file_helper import send
+import sys
+import time
+import threading
+import json
+import contextvars
+import contextlib
+import io
+
+err_msg = "schedule_managing.py: error: "
+
+# the schedule being managed. every client of the server has its own, see ScheduleServer
+current_schedule = contextvars.ContextVar("current_schedule")
+# how it is displayed is kept in display_settings, since the schedule of a date is shared by the clients
+
+# writes modified schedules in the background if --autosave/-A is given
+autosaver = None
+# sends schedules in the background, see Outbox
+outbox = None
+# schedules of the dates switched to with --read/-R, see Session
+session = None
+# records the time and memory spent by the commands if --profile is given, see Profiler
+profiler = None
+
+# ids of the temp files written, see _write_temp()
+temp_ids = itertools.count()
+# incremented when the format of the snapshot changes, see save_snapshot()
+snapshot_version = 2
+
+# a row of a schedule txt, either "(i) HH:MM-HH:MM HHh MMmin: task name"
+# or "(i)     task name" for a task sharing the time slice of the task above
+task_pat = re.compile(r"\((\d+?)\)(?: (\d\d):(\d\d)-(\d\d):(\d\d) \d+?h \d+?min: (.+)|\s+(.+))")
+# name of a schedule txt in the schedule dir
+date_file_pat = re.compile(r"^(\d{4}-\d{2}-\d{2})\.txt$")
 
 
 class TimeSlice:
+    # the duration is not stored since it always equals to end - start
+    __slots__ = ("start", "end")
+
     def __init__(self, start: datetime.datetime = None, duration: datetime.timedelta = None,
                  end: datetime.datetime = None):
         self.start = start
-        self.duration = duration
         self.end = end
+        if end is None and start is not None and duration is not None:
+            self.end = start + duration
+
+    @property
+    def duration(self):
+        if self.start is None or self.end is None:
+            return None
+        return self.end - self.start
+
+    @duration.setter
+    def duration(self, duration: datetime.timedelta):
+        self.end = self.start + duration
 
     def __eq__(self, other):
-        return self.start == other.start and self.duration == other.duration and self.end == other.end
+        return self.start == other.start and self.end == other.end
 
 
 class Task:
+    __slots__ = ("time_slice", "_name")
+
     def __init__(self, time_slice: TimeSlice = None, name: str = ''):
         self.time_slice = time_slice
         self.name = name
 
+    @property
+    def name(self):
+        return self._name
+
+    @name.setter
+    def name(self, name: str):
+        # task names repeat a lot across schedules, so a single copy of each name is kept
+        self._name = sys.intern(name) if isinstance(name, str) else name
+
+
+class OffsetTree:
+    # a fenwick tree of pending time deltas.
+    # adding a delta at an index shifts the task at the index and all tasks after it in O(log n)
+    def __init__(self, size: int):
+        self.size = size
+        self.tree = [datetime.timedelta()] * (size + 1)
+
+    def add(self, index, delta):
+        i = index + 1
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+
+    def prefix(self, index):
+        # the accumulated delta of the task at the index
+        delta = datetime.timedelta()
+        i = index + 1
+        while i > 0:
+            delta += self.tree[i]
+            i -= i & -i
+
+        return delta
+
+    def deltas(self):
+        # restores the raw deltas from the tree in O(n) and yields the accumulated delta of every task
+        raw = self.tree[:]
+        for i in range(self.size, 0, -1):
+            j = i + (i & -i)
+            if j <= self.size:
+                raw[j] -= raw[i]
+
+        delta = datetime.timedelta()
+        for i in range(1, self.size + 1):
+            delta += raw[i]
+            yield delta
+
+
+class GapIndex:
+    # free intervals between sorted intervals within [day_start, day_end),
+    # with a segment tree of their lengths to find the earliest free interval of at least a duration in O(log n).
+    # works with datetimes as well as minutes.
+    # an interval ending before its start ends after the midnight, so it takes the rest of the day.
+    # free intervals are never empty and never adjacent, so taking and releasing intervals which shrink or grow
+    # a free interval take O(log n), and ones which split, fill, join or add a free interval rebuild the tree in O(n)
+    def __init__(self, intervals, day_start, day_end):
+        self.starts = []
+        self.ends = []
+        self.zero = day_start - day_start
+        self.day_start = day_start
+        self.day_end = day_end
+        cursor = day_start
+        for start, end in intervals:
+            if end == start:
+                continue
+            if end < start:
+                end = day_end
+            if start > cursor:
+                self.starts.append(cursor)
+                self.ends.append(start)
+            cursor = max(cursor, end)
+        if cursor < day_end:
+            self.starts.append(cursor)
+            self.ends.append(day_end)
+
+        self._build()
+
+    def _build(self):
+        self.size = 1
+        while self.size < len(self.starts):
+            self.size *= 2
+        self.tree = [self.zero] * (2 * self.size)
+        for i in range(len(self.starts)):
+            self.tree[self.size + i] = self.ends[i] - self.starts[i]
+        for i in range(self.size - 1, 0, -1):
+            self.tree[i] = max(self.tree[2 * i], self.tree[2 * i + 1])
+
+    def _update(self, i):
+        # updates the length of the free interval at the index in the tree
+        node = self.size + i
+        self.tree[node] = self.ends[i] - self.starts[i]
+        while node > 1:
+            node //= 2
+            self.tree[node] = max(self.tree[2 * node], self.tree[2 * node + 1])
+
+    def _clamp(self, start, end):
+        if end < start:
+            end = self.day_end
+        return max(start, self.day_start), min(end, self.day_end)
+
+    def _used(self, i, start, end):
+        # True if no free interval overlaps [start, end), where i is the last free interval starting at or before start
+        return (i < 0 or self.ends[i] <= start) and (i + 1 >= len(self.starts) or self.starts[i + 1] >= end)
+
+    def take(self, start, end):
+        # marks [start, end) as used. returns False if it is partly free,
+        # True if it is inside a free interval or already used, like the time slice of a task in a group
+        start, end = self._clamp(start, end)
+        if start >= end:
+            return True
+
+        i = bisect.bisect_right(self.starts, start) - 1
+        if i < 0 or end > self.ends[i]:
+            return self._used(i, start, end)
+
+        if start == self.starts[i] and end == self.ends[i]:
+            self.starts.pop(i)
+            self.ends.pop(i)
+            self._build()
+        elif start > self.starts[i] and end < self.ends[i]:
+            self.starts.insert(i + 1, end)
+            self.ends.insert(i + 1, self.ends[i])
+            self.ends[i] = start
+            self._build()
+        else:
+            if start > self.starts[i]:
+                self.ends[i] = start
+            else:
+                self.starts[i] = end
+            self._update(i)
+
+        return True
+
+    def release(self, start, end):
+        # marks [start, end) as free. returns False if it is not all used
+        start, end = self._clamp(start, end)
+        if start >= end:
+            return True
+
+        i = bisect.bisect_right(self.starts, start) - 1
+        if not self._used(i, start, end):
+            return False
+
+        joins_before = i >= 0 and self.ends[i] == start
+        joins_after = i + 1 < len(self.starts) and self.starts[i + 1] == end
+        if joins_before and joins_after:
+            self.ends[i] = self.ends.pop(i + 1)
+            self.starts.pop(i + 1)
+            self._build()
+        elif joins_before:
+            self.ends[i] = end
+            self._update(i)
+        elif joins_after:
+            self.starts[i + 1] = start
+            self._update(i + 1)
+        else:
+            self.starts.insert(i + 1, start)
+            self.ends.insert(i + 1, end)
+            self._build()
+
+        return True
+
+    def _first_at_least(self, lo, duration, node=1, node_lo=0, node_hi=None):
+        # the first free interval from lo whose length is at least the duration
+        if node_hi is None:
+            node_hi = self.size
+        if node_hi <= lo or node_lo >= len(self.starts) or self.tree[node] < duration:
+            return None
+        if node_hi - node_lo == 1:
+            return node_lo
+
+        mid = (node_lo + node_hi) // 2
+        i = self._first_at_least(lo, duration, 2 * node, node_lo, mid)
+        if i is None:
+            i = self._first_at_least(lo, duration, 2 * node + 1, mid, node_hi)
+
+        return i
+
+    def find(self, duration, after):
+        # the earliest start of a free interval of at least the duration not earlier than after, None if not found
+        i = bisect.bisect_right(self.ends, after)
+        if i >= len(self.starts):
+            return None
+
+        start = max(self.starts[i], after)
+        if self.ends[i] - start >= duration:
+            return start
+
+        i = self._first_at_least(i + 1, duration)
+        return None if i is None else self.starts[i]
+
+
+class DisplaySettings:
+    # every client of the server has its own, and the commands of a client change them in place,
+    # since the commands run in threads with a copy of the context of the client
+    __slots__ = ("window", "auto")
+
+    def __init__(self, window=None, auto=True):
+        # number of rows displayed around the changed rows after a modification, the whole schedule if None
+        self.window = window
+        # displays the schedule after every modification if True, turned off in batch mode
+        self.auto = auto
+
+
+display_settings = contextvars.ContextVar("display_settings", default=DisplaySettings())
+
 
 class Schedule:
+    # max number of modifications which can be undone
+    history_size = 100
+
     def __init__(self, task_list: list = None, date: datetime.date = None, schedule_str: str = ''):
         if task_list:
             self.task_list = task_list
@@ -37,48 +294,147 @@ class Schedule:
         self.schedule_str = schedule_str
         self.path = os.path.join("schedule", f"{self.date.isoformat()}.txt")
         self.saved = False
+        # incremented on every modification, see AutoSaver
+        self.version = 0
+        # True if the txt at the path is written or read by this schedule, so it can be overridden by autosaving
+        self.owns_path = False
+        # (mtime, size) of the txt when it is last written or read by this schedule, see Session
+        self.file_stat = None
+        # guards saved, version, owns_path and file_stat, which are also set by the thread of AutoSaver
+        self.lock = threading.Lock()
+        # time deltas not yet applied to the time slices of the tasks, see modify_a_task()
+        self._offsets = None
+        # rendered rows of the schedule str, see _schedule_format().
+        # rows from _dirty_from on and rows in _dirty_rows are rendered again when the schedule is formatted
+        self._rows = []
+        self._dirty_from = 0
+        self._dirty_rows = set()
+        self._changed_from = None
+        # entries of modifications to be undone and redone, see _record()
+        self.history = collections.deque(maxlen=Schedule.history_size)
+        self.future = []
+        # free time slices of the schedule, built when queried and kept up to date until a task is retimed,
+        # see find_free_slot()
+        self._gaps = None
 
     def set_path(self):
         self.path = os.path.join("schedule", f"{self.date.isoformat()}.txt")
 
+    def find_free_slot(self, duration, after=None):
+        # the earliest start of a free time slice of at least the duration from after (the start of the day by default),
+        # None if not found
+        self._apply_offsets()
+        midnight = datetime.datetime(year=self.date.year, month=self.date.month, day=self.date.day)
+        if self._gaps is None:
+            self._gaps = GapIndex(((task.time_slice.start, task.time_slice.end) for task in self.task_list),
+                                  midnight, midnight + datetime.timedelta(days=1))
+
+        return self._gaps.find(duration, after or midnight)
+
+    def _offset(self, task_index):
+        if self._offsets is None:
+            return datetime.timedelta()
+        return self._offsets.prefix(task_index)
+
+    def _shift(self, task_index, time_delta):
+        # shifts the task at the index and all tasks after it lazily
+        if task_index >= len(self.task_list) or not time_delta:
+            return
+        if self._offsets is None:
+            self._offsets = OffsetTree(len(self.task_list))
+        self._offsets.add(task_index, time_delta)
+
+    def _apply_offsets(self):
+        # applies pending time deltas to the time slices.
+        # should be called before the time slices are read or the task list is restructured
+        if self._offsets is None:
+            return
+
+        for task, time_delta in zip(self.task_list, self._offsets.deltas()):
+            if time_delta:
+                task.time_slice.start += time_delta
+                task.time_slice.end += time_delta
+        self._offsets = None
+
+    def _mark_dirty(self, task_index, shifted=True):
+        if shifted:
+            # the row and all rows after it are changed
+            if self._dirty_from is None or task_index < self._dirty_from:
+                self._dirty_from = task_index
+        else:
+            # only the row itself is changed
+            self._dirty_rows.add(task_index)
+
+    def _insert(self, task_index, task):
+        self.task_list.insert(task_index, task)
+        self._mark_dirty(task_index)
+        # the free time slices are kept up to date, or built again when queried if the task is not in a free one
+        if self._gaps is not None and not self._gaps.take(task.time_slice.start, task.time_slice.end):
+            self._gaps = None
+
+        return task_index
+
+    def _remove(self, task_index):
+        task = self.task_list.pop(task_index)
+        self._mark_dirty(task_index)
+        if self._gaps is not None:
+            # the time slice is freed unless another task of its group or an overlapping task still takes it
+            time_slice = task.time_slice
+            neighbors = [other.time_slice for other in self.task_list[max(task_index - 1, 0):task_index + 1]]
+            overlapping = [other for other in neighbors
+                           if other.start < time_slice.end and other.end > time_slice.start]
+            if overlapping:
+                if not any(other == time_slice for other in overlapping):
+                    self._gaps = None
+            elif not self._gaps.release(time_slice.start, time_slice.end):
+                self._gaps = None
+
+        return task
+
     def _task_append(self, new_task):
+        self._apply_offsets()
+        time_slice = new_task.time_slice
+
         if not self.task_list:
             # if the task list is empty, appends the new task to the list directly
-            self.task_list.append(new_task)
-            return
-        elif self.task_list[-1].time_slice.end <= new_task.time_slice.start:
+            return self._insert(len(self.task_list), new_task)
+        elif self.task_list[-1].time_slice.end <= time_slice.start:
             # if the start time of the new task is later than the end time of the last task in the list,
             # appends the new task to the list directly
-            self.task_list.append(new_task)
-            return
-        elif self.task_list[0].time_slice.start >= new_task.time_slice.end:
+            return self._insert(len(self.task_list), new_task)
+        elif self.task_list[0].time_slice.start >= time_slice.end:
             # if the end time of the new task is earlier than the start time of the first task in the list,
             # inserts the new task to the head of the list
-            self.task_list.insert(0, new_task)
-            return
-        else:
-            # if there is at least one task in the task list whose time slice is the same as that of the new task,
-            # appends the new task to the task list and sorts the list
-            for i in range(len(self.task_list)):
-                if self.task_list[i].time_slice == new_task.time_slice:
-                    self.task_list.append(new_task)
-                    self.task_list.sort(key=lambda task: task.time_slice.start)
-                    return
+            return self._insert(0, new_task)
 
-            for i in range(len(self.task_list) - 1):
-                # if there is no task in the task list whose time slice id the same as that of the new task,
-                # finds if there is a time slice that is not occupied by the existed tasks.
-                # if one is found, appends the new task to the task list and sorts the list
-                if self.task_list[i].time_slice.start != self.task_list[i + 1].time_slice.start \
-                        and self.task_list[i].time_slice.end <= new_task.time_slice.start \
-                        and new_task.time_slice.end <= self.task_list[i + 1].time_slice.start:
-                    self.task_list.append(new_task)
-                    self.task_list.sort(key=lambda task: task.time_slice.start)
-                    return
+        # the task list is kept sorted by start time, so the position of the new task is found by bisection
+        # instead of scanning the list and sorting it again after every insertion
+        lo = bisect.bisect_left(self.task_list, time_slice.start, key=lambda task: task.time_slice.start)
+        hi = bisect.bisect_right(self.task_list, time_slice.start, lo=lo, key=lambda task: task.time_slice.start)
+
+        # if there is at least one task in the task list whose time slice is the same as that of the new task,
+        # inserts the new task after the tasks starting at the same time
+        for i in range(lo, hi):
+            if self.task_list[i].time_slice == time_slice:
+                return self._insert(hi, new_task)
+
+        # otherwise the new task should fit in the gap before the first task starting at or after its end time.
+        # as tasks in the list do not overlap, only the task just before the gap needs to be checked
+        i = bisect.bisect_left(self.task_list, time_slice.end, lo=lo, key=lambda task: task.time_slice.start)
+        if self.task_list[i - 1].time_slice.end <= time_slice.start:
+            return self._insert(hi, new_task)
 
         print(f"{err_msg}time slice conflict")
         raise Exception
 
+    def _suggest_free_slot(self, time_slice):
+        # prints where a task conflicting with others fits.
+        # not done in _task_append() since the free time slices are only needed when a task conflicts
+        free_start = self.find_free_slot(time_slice.duration, time_slice.start)
+        if free_start is not None:
+            print(f"the earliest free time slice of {Schedule._strf(time_slice.duration)} "
+                  f"after {Schedule._strf_time(time_slice.start)} starts at {Schedule._strf_time(free_start)}")
+
     @staticmethod
     def _duration_end_validation(start, duration, end):
         if not duration and not end:
@@ -126,24 +482,129 @@ class Schedule:
 
         return f"{str(hours).zfill(2)}h {str(minutes).zfill(2)}min"
 
+    @staticmethod
+    def _strf_time(time):
+        return f"{str(time.hour).zfill(2)}:{str(time.minute).zfill(2)}"
+
+    def _render_row(self, i):
+        time_slice = self.task_list[i].time_slice
+        name = self.task_list[i].name
+        if i > 0 \
+                and time_slice.start == self.task_list[i - 1].time_slice.start \
+                and time_slice.end == self.task_list[i - 1].time_slice.end:
+            return f"({i}) {' '.ljust(26 - len(str(i)) - 2)}{name}\n"
+        else:
+            start = Schedule._strf_time(time_slice.start)
+            duration = Schedule._strf(time_slice.duration)
+            end = Schedule._strf_time(time_slice.end)
+
+            return f"({i}) {start}-{end} {duration}: {name}\n"
+
     def _schedule_format(self):
-        self.schedule_str = ''
-
-        for i in range(len(self.task_list)):
-            time_slice = self.task_list[i].time_slice
-            name = self.task_list[i].name
-            if i > 0 \
-                    and time_slice.start == self.task_list[i - 1].time_slice.start \
-                    and time_slice.end == self.task_list[i - 1].time_slice.end:
-                self.schedule_str += f"({i}) {' '.ljust(26 - len(str(i)) - 2)}{name}\n"
+        self._apply_offsets()
+
+        # only the rows changed since the last formatting are rendered again
+        changed = list(self._dirty_rows)
+        if self._dirty_from is not None:
+            changed.append(self._dirty_from)
+
+        if self._dirty_from is not None:
+            del self._rows[self._dirty_from:]
+            self._rows.extend(self._render_row(i) for i in range(self._dirty_from, len(self.task_list)))
+        for i in self._dirty_rows:
+            if i < len(self._rows):
+                self._rows[i] = self._render_row(i)
+
+        self._dirty_from = None
+        self._dirty_rows.clear()
+        if changed:
+            self._changed_from = min(changed)
+
+        self.schedule_str = ''.join(self._rows)
+
+    def _modified(self):
+        settings = display_settings.get()
+        if settings.auto:
+            self.display_schedule(settings.window)
+        with self.lock:
+            self.saved = False
+            self.version += 1
+
+    def _record(self, ops):
+        # records the ops of a modification so that it can be undone.
+        # an op is one of
+        # ("insert", index, task), ("pop", index, task),
+        # ("rename", index, old name, new name) and ("retime", index, old time slice, new time slice, time delta),
+        # where the time slices are (start, end) without pending time deltas.
+        # each op is undone by its inverse in O(log n) besides the insertion into and the deletion from the list
+        if ops:
+            self.history.append(ops)
+            self.future.clear()
+
+    def _apply_op(self, op, undo):
+        kind, task_index = op[0], op[1]
+        if kind in ("insert", "pop"):
+            self._apply_offsets()
+            if (kind == "insert") != undo:
+                self._insert(task_index, op[2])
+            else:
+                self._remove(task_index)
+        elif kind == "rename":
+            self.task_list[task_index].name = op[2] if undo else op[3]
+            self._mark_dirty(task_index, shifted=False)
+        elif kind == "retime":
+            if undo:
+                (start, end), time_delta = op[2], -op[4]
             else:
-                start = time_slice.start.strftime("%H:%M")
-                duration = Schedule._strf(time_slice.duration)
-                end = time_slice.end.strftime("%H:%M")
+                (start, end), time_delta = op[3], op[4]
+            offset = self._offset(task_index)
+            self.task_list[task_index].time_slice = TimeSlice(start - offset, None, end - offset)
+            self._shift(task_index + 1, time_delta)
+            self._mark_dirty(task_index)
+            # the shift moves every free time slice after the task, so they are built again when queried
+            self._gaps = None
+
+    def undo(self):
+        if not self.history:
+            print(f"{err_msg}nothing to undo")
+            raise Exception
+
+        ops = self.history.pop()
+        for op in reversed(ops):
+            self._apply_op(op, undo=True)
+        self.future.append(ops)
+
+        self._modified()
+
+    def redo(self):
+        if not self.future:
+            print(f"{err_msg}nothing to redo")
+            raise Exception
+
+        ops = self.future.pop()
+        for op in ops:
+            self._apply_op(op, undo=False)
+        self.history.append(ops)
+
+        self._modified()
+
+    def add_a_task(self, start, duration, end, task_name, rest_duration, auto=False):
+        self._apply_offsets()
+
+        # places the task at the earliest free time slice after the start time if auto is True
+        if auto:
+            if not duration:
+                print(f"{err_msg}argument --duration/-d is required with --auto/-a")
+                raise Exception
 
-                self.schedule_str += f"({i}) {start}-{end} {duration}: {name}\n"
+            rest = rest_duration[0] if rest_duration else datetime.timedelta()
+            free_start = self.find_free_slot(duration + rest, start)
+            if free_start is None:
+                print(f"{err_msg}no free time slice of {Schedule._strf(duration + rest)}"
+                      f"{f' after {Schedule._strf_time(start)}' if start else ''}")
+                raise Exception
+            start, end = free_start, None
 
-    def add_a_task(self, start, duration, end, task_name, rest_duration):
         start, duration, end, task_name = self._add_validation(start, duration, end, task_name)
 
         # creates a task
@@ -151,21 +612,27 @@ class Schedule:
         task.time_slice = TimeSlice(start, duration, end)
         task.name = task_name
 
-        # appends the task to the task list
-        self._task_append(task)
+        ops = []
+        try:
+            # appends the task to the task list
+            ops.append(("insert", self._task_append(task), task))
 
-        # creates a task for taking a rest if -r [REST-DURATION] is provided
-        if rest_duration:
-            # creates a task
-            rest = Task()
-            rest.time_slice = TimeSlice(end, rest_duration[0], end + rest_duration[0])
-            rest.name = "take a rest"
+            # creates a task for taking a rest if -r [REST-DURATION] is provided
+            if rest_duration:
+                # creates a task
+                rest = Task()
+                rest.time_slice = TimeSlice(end, rest_duration[0], end + rest_duration[0])
+                rest.name = "take a rest"
 
-            # appends the task to the task list
-            self._task_append(rest)
+                # appends the task to the task list
+                ops.append(("insert", self._task_append(rest), rest))
+        except Exception:
+            self._suggest_free_slot(rest.time_slice if ops else task.time_slice)
+            raise
+        finally:
+            self._record(ops)
 
-        self.display_schedule()
-        self.saved = False
+        self._modified()
 
     def modify_a_task(self, task_index, start, duration, end, task_name):
         # start or task name should be provided
@@ -173,50 +640,61 @@ class Schedule:
             print(f"{err_msg}one of the arguments --start/- --task-name/-t is required")
             raise Exception
 
-        # modifies the task name
-        if task_name:
-            self.task_list[task_index].name = task_name
-
-        # modifies the time slice
-        if start:
-            # modifies the task time slice
-            time_slice = self.task_list[task_index].time_slice
-            time_slice_copy = copy.deepcopy(time_slice)  # deep copy
-
-            time_slice_copy.start = start
-            time_slice_copy.duration, time_slice_copy.end = self._duration_end_validation(start, duration, end)
-
-            # start time of the task should be later than that of its preceding task
-            if 0 < task_index and self.task_list[task_index - 1].time_slice.end > time_slice_copy.start:
-                print(f"{err_msg}time slice conflict")
-                raise Exception
-
-            time_delta = time_slice_copy.start - time_slice.start
-
-            time_slice.start, time_slice.duration, time_slice.end = \
-                time_slice_copy.start, time_slice_copy.duration, time_slice_copy.end
-
-            # modifies the time slice of tasks after the current task
-            for i in range(task_index + 1, len(self.task_list)):
-                time_slice = self.task_list[i].time_slice
-
-                time_slice.start += time_delta
-                time_slice.end += time_delta
-
-        self.display_schedule()
-        self.saved = False
+        ops = []
+        try:
+            # modifies the task name
+            if task_name:
+                ops.append(("rename", task_index, self.task_list[task_index].name, task_name))
+                self.task_list[task_index].name = task_name
+                self._mark_dirty(task_index, shifted=False)
+
+            # modifies the time slice
+            if start:
+                # modifies the task time slice
+                time_slice = self.task_list[task_index].time_slice
+                # the time slice may have a pending time delta which is not applied yet
+                offset = self._offset(task_index)
+
+                duration, end = self._duration_end_validation(start, duration, end)
+
+                # start time of the task should be later than that of its preceding task
+                if 0 < task_index \
+                        and self.task_list[task_index - 1].time_slice.end + self._offset(task_index - 1) > start:
+                    print(f"{err_msg}time slice conflict")
+                    raise Exception
+
+                time_delta = start - (time_slice.start + offset)
+                ops.append(("retime", task_index, (time_slice.start + offset, time_slice.end + offset), (start, end),
+                            time_delta))
+
+                self.task_list[task_index].time_slice = TimeSlice(start - offset, duration, end - offset)
+
+                # modifies the time slice of tasks after the current task.
+                # the time delta is recorded in the offset tree and applied when the time slices are read
+                self._shift(task_index + 1, time_delta)
+                self._mark_dirty(task_index)
+                # the shift moves every free time slice after the task, so they are built again when queried
+                self._gaps = None
+        finally:
+            self._record(ops)
+
+        self._modified()
 
     def delete_a_task(self, task_index):
-        self.task_list.pop(task_index)
-        self.display_schedule()
-        self.saved = False
+        self._apply_offsets()
+        self._record([("pop", task_index, self._remove(task_index))])
 
-    def save_to_txt(self):
+        self._modified()
+
+    def save_to_txt(self, override=False):
         if not self.task_list:
             print("nothing saved. the task list is empty")
             return
 
         try:
+            if override:
+                # overrides the existing txt without asking
+                raise FileNotFoundError
             with open(self.path) as f:
                 content = f.read()
         except FileNotFoundError:
@@ -234,18 +712,292 @@ class Schedule:
                 return
 
         self._schedule_format()
-        with open(self.path, 'w') as f:
-            f.write(self.schedule_str)
+        atomic_write(self.path, self.schedule_str)
+
+        with self.lock:
+            self.saved = True
+            self.owns_path = True
+            self.file_stat = file_stat(self.path)
+
+        # keeps the archive index up to date. copies are not indexed
+        if date_file_pat.search(os.path.basename(self.path)):
+            import sqlite3
 
-        self.saved = True
+            try:
+                ArchiveIndex(os.path.dirname(self.path)).update(self)
+            except sqlite3.Error as e:
+                print(f"{err_msg}failed to update the archive index: {e}")
 
-    def send_to_wechat(self):
+    def send_to_wechat(self, outbox_=None):
         self._schedule_format()
-        send([self.schedule_str])
+        if outbox_ is None:
+            WechatTransport().send([self.schedule_str])
+        else:
+            outbox_.put(self.date.isoformat(), self.schedule_str)
 
-    def display_schedule(self):
+    def display_schedule(self, window=None):
         self._schedule_format()
-        print(self.schedule_str)
+
+        if window is None or self._changed_from is None:
+            print(self.schedule_str)
+            return
+
+        # displays the rows around the first changed row only
+        first = max(self._changed_from - window, 0)
+        last = min(self._changed_from + window + 1, len(self._rows))
+        rows = self._rows[first:last]
+        if first > 0:
+            rows.insert(0, "...\n")
+        if last < len(self._rows):
+            rows.append("...\n")
+        print(''.join(rows))
+
+
+def _write_temp(path, content):
+    # writes the content to a new temp file next to the path and returns the path of the temp file.
+    # the name is unique, so threads writing the same path at the same time do not write the same temp file
+    while True:
+        temp_path = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.{os.getpid()}."
+                                                        f"{next(temp_ids)}.tmp")
+        try:
+            fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0), 0o666)
+        except FileExistsError:
+            # left by a process with the same pid
+            continue
+        break
+
+    try:
+        with open(fd, 'wb' if isinstance(content, bytes) else 'w') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+    return temp_path
+
+
+def atomic_write(path, content):
+    # writes to a temp file in the same dir and replaces the file with it,
+    # so the file is never left partly written
+    os.replace(_write_temp(path, content), path)
+
+
+def atomic_write_many(contents):
+    # writes many files like atomic_write(), but replaces them only after all temp files are written,
+    # so a failure leaves none of the files changed.
+    # contents are {path: content}
+    temp_paths = {}
+    try:
+        for path, content in contents.items():
+            temp_paths[path] = _write_temp(path, content)
+    except BaseException:
+        for temp_path in temp_paths.values():
+            os.remove(temp_path)
+        raise
+    for path, temp_path in temp_paths.items():
+        os.replace(temp_path, path)
+
+
+def file_stat(path):
+    # (mtime, size) of a file, None if it does not exist
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+
+    return stat.st_mtime_ns, stat.st_size
+
+
+class AutoSaver:
+    # writes modified schedules to their txts in a background thread
+    # once they are not modified for `delay` seconds
+    def __init__(self, delay: float = 1.0):
+        self.delay = delay
+        self.pending = {}  # path: (schedule, version, schedule str)
+        self.deadline = 0
+        self.writing = False
+        self.stopped = False
+        self.skipped = set()
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def notify(self, schedule_):
+        # called after every command with the current schedule
+        with schedule_.lock:
+            if schedule_.saved or not schedule_.task_list:
+                return
+            # owns_path is set before the txt is written by the thread, so a txt written by it is not taken as another
+            foreign = not schedule_.owns_path and os.path.exists(schedule_.path)
+        if foreign:
+            # the txt is not written by the schedule, so it is not overridden silently
+            if schedule_.path not in self.skipped:
+                self.skipped.add(schedule_.path)
+                print(f"{err_msg}{os.path.basename(schedule_.path)} exists. "
+                      f"it will be autosaved after it is saved with --save/-s")
+            return
+
+        schedule_._schedule_format()
+        with self.condition:
+            self.pending[schedule_.path] = (schedule_, schedule_.version, schedule_.schedule_str)
+            self.deadline = time.monotonic() + self.delay
+            self.condition.notify_all()
+
+    def _run(self):
+        with self.condition:
+            while True:
+                while not self.pending and not self.stopped:
+                    self.condition.wait()
+                if not self.pending:
+                    return
+
+                # waits until the schedules are not modified for a while
+                remaining = self.deadline - time.monotonic()
+                if remaining > 0 and not self.stopped:
+                    self.condition.wait(remaining)
+                    continue
+
+                pending, self.pending = self.pending, {}
+                self.writing = True
+                self.condition.release()
+                try:
+                    for path, (schedule_, version, schedule_str) in pending.items():
+                        with schedule_.lock:
+                            owns_path, schedule_.owns_path = schedule_.owns_path, True
+                        try:
+                            atomic_write(path, schedule_str)
+                        except OSError as e:
+                            with schedule_.lock:
+                                schedule_.owns_path = owns_path
+                            print(f"{err_msg}failed to autosave {os.path.basename(path)}: {e}")
+                            continue
+
+                        with schedule_.lock:
+                            schedule_.file_stat = file_stat(path)
+                            # the schedule may be modified again while being written
+                            if schedule_.version == version:
+                                schedule_.saved = True
+                finally:
+                    self.condition.acquire()
+                    self.writing = False
+                    self.condition.notify_all()
+
+    def flush(self):
+        # writes the pending schedules now and waits for them to be written
+        with self.condition:
+            self.deadline = 0
+            self.condition.notify_all()
+            while self.pending or self.writing:
+                self.condition.wait()
+
+    def close(self):
+        self.flush()
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        self.thread.join()
+
+
+class WechatTransport:
+    def send(self, messages):
+        # imported only when something is sent
+        from wechat_file_helper import send
+
+        send(messages)
+
+
+class LocalTransport:
+    # appends the messages to a file instead of sending them, so sending can be tested offline.
+    # the delay simulates the latency of the network
+    def __init__(self, path: str = os.path.join("schedule", ".outbox_sent.txt"), delay: float = 0):
+        self.path = path
+        self.delay = delay
+
+    def send(self, messages):
+        time.sleep(self.delay)
+        with open(self.path, 'a') as f:
+            for message in messages:
+                f.write(f"{message}\n")
+
+
+class Outbox:
+    # sends messages in a background thread.
+    # a message replaces the unsent message with the same key, failed sends are retried with exponential backoff,
+    # and unsent messages are kept in a json so they are sent after a restart
+    def __init__(self, transport, path: str = os.path.join("schedule", ".outbox.json"),
+                 retry_delay: float = 1.0, max_retry_delay: float = 60.0):
+        self.transport = transport
+        self.path = path
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.stopped = False
+        self.condition = threading.Condition()
+
+        try:
+            with open(self.path) as f:
+                self.pending = dict(json.load(f))
+        except (FileNotFoundError, ValueError):
+            self.pending = {}
+
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _persist(self):
+        atomic_write(self.path, json.dumps(list(self.pending.items())))
+
+    def put(self, key, message):
+        with self.condition:
+            # the message replaces the unsent one with the same key, and is sent after the others
+            self.pending.pop(key, None)
+            self.pending[key] = message
+            self._persist()
+            self.condition.notify_all()
+
+    def _run(self):
+        delay = self.retry_delay
+        with self.condition:
+            while True:
+                while not self.pending and not self.stopped:
+                    self.condition.wait()
+                if self.stopped:
+                    return
+
+                key, message = next(iter(self.pending.items()))
+                self.condition.release()
+                try:
+                    self.transport.send([message])
+                except Exception as e:
+                    sent = False
+                    print(f"{err_msg}failed to send {key}: {e!r}. retry in {delay:g}s")
+                else:
+                    sent = True
+                finally:
+                    self.condition.acquire()
+
+                if sent:
+                    # the message may be replaced while being sent
+                    if self.pending.get(key) is message:
+                        del self.pending[key]
+                        self._persist()
+                        # wakes up close() waiting for the pending messages
+                        self.condition.notify_all()
+                    delay = self.retry_delay
+                else:
+                    self.condition.wait(delay)
+                    delay = min(delay * 2, self.max_retry_delay)
+
+    def close(self, timeout: float = 5.0):
+        # waits at most timeout seconds for the pending messages to be sent.
+        # the unsent messages are kept for the next run
+        with self.condition:
+            self.condition.wait_for(lambda: not self.pending, timeout)
+            self.stopped = True
+            self.condition.notify_all()
+        self.thread.join()
+        with self.condition:
+            self._persist()
 
 
 def make_dir():
@@ -255,62 +1007,1148 @@ def make_dir():
         pass
 
 
-def read_from_txt(schedule_date):
-    # saves the current schedule
-    global schedule
-    if schedule.task_list:
-        schedule.save_to_txt()
+def parse_schedule(lines, date: datetime.date, strict=False):
+    # yields the tasks in the lines of a schedule txt.
+    # tasks in the same group have the time of the first task of the group, each in its own time slice.
+    # lines which are not tasks are skipped, or raise ValueError if strict is True
+    times = {}
+    time_slice = None
+    for line_no, line in enumerate(lines, start=1):
+        rst = task_pat.search(line)
+        if not rst:
+            if strict and line.strip():
+                raise ValueError(f"line {line_no}: not a task: {line.strip()}")
+            continue
+
+        if rst.group(2):
+            start_h, start_min, end_h, end_min = int(rst.group(2)), int(rst.group(3)), int(rst.group(4)), \
+                int(rst.group(5))
+
+            # datetime objs are immutable, so equal times are shared by the time slices
+            start = times.get((start_h, start_min))
+            if start is None:
+                start = times[(start_h, start_min)] = datetime.datetime(year=date.year, month=date.month,
+                                                                         day=date.day, hour=start_h, minute=start_min)
+            end = times.get((end_h, end_min))
+            if end is None:
+                end = times[(end_h, end_min)] = datetime.datetime(year=date.year, month=date.month,
+                                                                   day=date.day, hour=end_h, minute=end_min)
+
+            time_slice = TimeSlice(start, None, end)
+            yield Task(time_slice, rst.group(6))
+        elif time_slice is not None:
+            yield Task(TimeSlice(time_slice.start, None, time_slice.end), rst.group(7))
+        else:
+            raise ValueError(f"line {line_no}: a task without time slice is not in a group")
+
+
+def load_schedule(path, date: datetime.date = None, strict=False):
+    # reads a schedule from its txt without touching the current schedule
+    if date is None:
+        date = datetime.date.fromisoformat(os.path.basename(path)[:10])
+
+    with open(path) as f:
+        stat = os.fstat(f.fileno())
+        schedule_ = Schedule(task_list=list(parse_schedule(f, date, strict)), date=date)
+    schedule_.path = path
+    schedule_.saved = True
+    schedule_.owns_path = True
+    schedule_.file_stat = (stat.st_mtime_ns, stat.st_size)
+
+    return schedule_
+
+
+def save_snapshot(schedule_, directory="schedule"):
+    # keeps the schedule open at the exit in a pickle, so --resume opens it without parsing its txt.
+    # the tasks are kept only if they are the ones in the txt
+    import pickle
+
+    task_list = None
+    if schedule_.saved and schedule_.owns_path and schedule_.file_stat is not None:
+        schedule_._apply_offsets()
+        task_list = schedule_.task_list
+
+    atomic_write(os.path.join(directory, ".last.snapshot"),
+                 pickle.dumps((snapshot_version, schedule_.date, schedule_.path, schedule_.file_stat, task_list),
+                              protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def load_snapshot(directory="schedule"):
+    # the schedule open at the last exit, None if there is none.
+    # it is read from the snapshot if its txt is not changed since the snapshot is written, from the txt otherwise
+    import pickle
+
+    try:
+        with open(os.path.join(directory, ".last.snapshot"), 'rb') as f:
+            version, date, path, stat, task_list = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, pickle.UnpicklingError, EOFError, ValueError, TypeError, AttributeError) as e:
+        print(f"{err_msg}the snapshot is not read: {e!r}")
+        return None
+    if version != snapshot_version:
+        return None
+
+    if task_list is not None and file_stat(path) == stat:
+        schedule_ = Schedule(task_list=task_list, date=date)
+        schedule_.path = path
+        schedule_.saved = True
+        schedule_.owns_path = True
+        schedule_.file_stat = stat
+        return schedule_
 
     try:
-        with open(os.path.join("schedule", f"{schedule_date}.txt"), 'r') as f:
-            schedule_str = f.read()
+        return load_schedule(path, date)
     except FileNotFoundError:
-        print(f"{err_msg}{schedule_date}.txt not exists")
+        return None
+    except ValueError as e:
+        print(f"{err_msg}{os.path.basename(path)}: {e}")
+        return None
+
+
+def read_from_txt(schedule_date, override=False):
+    # switches to the schedule of the date. the current schedule is kept in the session without being saved
+    if autosaver is not None:
+        autosaver.flush()
+
+    schedule_ = current_schedule.get()
+    new_schedule = session.open(schedule_, schedule_date, override)
+    current_schedule.set(new_schedule)
+
+    if display_settings.get().auto:
+        new_schedule.display_schedule()
+
+
+class Session:
+    # keeps the schedules of the recently used dates, so switching between dates neither saves nor reparses them.
+    # a kept schedule is read again only if it is saved and its txt is changed since it is last written or read.
+    # at most `size` schedules are kept. the least recently used ones are dropped first,
+    # and saved before if they are modified
+    def __init__(self, size: int = 8):
+        self.size = max(size, 1)
+        self.schedules = collections.OrderedDict()  # date: schedule
+        # the server opens schedules in many threads
+        self.lock = threading.RLock()
+        # numbers of the users of the dates. schedules in use are never dropped, see ScheduleServer
+        self.in_use = collections.Counter()
+
+    def put(self, schedule_, override=False):
+        key = schedule_.date.isoformat()
+        with self.lock:
+            self.schedules[key] = schedule_
+            self.schedules.move_to_end(key)
+            self._evict(override)
+
+    def open(self, current, schedule_date, override=False, create=False):
+        # returns the schedule of the date, a new one if its txt does not exist and create is True.
+        # the current schedule is kept
+        with self.lock:
+            return self._open(current, schedule_date, override, create)
+
+    def _open(self, current, schedule_date, override, create):
+        if current is not None:
+            self.put(current, override)
+
+        path = os.path.join("schedule", f"{schedule_date}.txt")
+        stat = file_stat(path)
+        schedule_ = self.schedules.get(schedule_date)
+        if schedule_ is not None:
+            if not schedule_.saved:
+                if stat is not None and stat != schedule_.file_stat:
+                    print(f"{err_msg}{schedule_date}.txt is changed since it is read. "
+                          f"the modified schedule is kept")
+                self.schedules.move_to_end(schedule_date)
+                return schedule_
+            if stat is not None and stat == schedule_.file_stat:
+                self.schedules.move_to_end(schedule_date)
+                return schedule_
+            del self.schedules[schedule_date]
+
+        if stat is None and create:
+            schedule_ = Schedule(date=datetime.date.fromisoformat(schedule_date))
+            self.put(schedule_, override)
+            return schedule_
+        if stat is None:
+            print(f"{err_msg}{schedule_date}.txt not exists")
+            raise Exception
+        try:
+            schedule_ = load_schedule(path, datetime.date.fromisoformat(schedule_date))
+        except FileNotFoundError:
+            print(f"{err_msg}{schedule_date}.txt not exists")
+            raise Exception
+        except ValueError as e:
+            print(f"{err_msg}{schedule_date}.txt: {e}")
+            raise Exception
+        self.put(schedule_, override)
+
+        return schedule_
+
+    def _evict(self, override=False):
+        # the most recently used schedule is never dropped
+        for key in list(self.schedules)[:-1]:
+            if len(self.schedules) <= self.size:
+                break
+
+            schedule_ = self.schedules[key]
+            if self.in_use[key]:
+                continue
+            if not schedule_.saved and schedule_.task_list:
+                # a txt not written by the schedule is not overridden without asking
+                schedule_.save_to_txt(override or schedule_.owns_path)
+                if not schedule_.saved:
+                    continue
+            del self.schedules[key]
+
+    def unsaved(self, current=None):
+        # the modified schedules, the current one last
+        with self.lock:
+            unsaved = [schedule_ for schedule_ in self.schedules.values()
+                       if schedule_ is not current and not schedule_.saved and schedule_.task_list]
+        if current is not None and not current.saved:
+            unsaved.append(current)
+
+        return unsaved
+
+
+class ArchiveIndex:
+    # an sqlite index of the schedule txts in a dir, keyed by date, task name and time range.
+    # times are stored as minutes since the midnight of the date, so a task ending after the midnight ends after 1440.
+    # totals are the minutes spent on every task name on every date, kept for the reports
+    schema = """
+        CREATE TABLE IF NOT EXISTS files (date TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER);
+        CREATE TABLE IF NOT EXISTS tasks (date TEXT, task_index INTEGER, name TEXT, start INTEGER, end INTEGER);
+        CREATE INDEX IF NOT EXISTS tasks_date ON tasks (date, start);
+        CREATE INDEX IF NOT EXISTS tasks_name ON tasks (name, date);
+        CREATE TABLE IF NOT EXISTS totals (date TEXT, name TEXT, minutes INTEGER, PRIMARY KEY (date, name));
+    """
+    # incremented when tables are added or the rows change, see _connect()
+    version = 2
+
+    # first date of the period of a date, see report()
+    periods = {
+        "day": "date",
+        "week": "date(date, '-' || ((CAST(strftime('%w', date) AS INTEGER) + 6) % 7) || ' days')",
+        "month": "substr(date, 1, 7)",
+        "year": "substr(date, 1, 4)",
+    }
+
+    def __init__(self, directory: str = "schedule"):
+        self.directory = directory
+        self.path = os.path.join(directory, ".index.sqlite3")
+
+    def _connect(self):
+        # sqlite3 is imported when the index is used, so it does not slow down the startup
+        import sqlite3
+
+        connection = sqlite3.connect(self.path)
+        connection.executescript(ArchiveIndex.schema)
+        if connection.execute("PRAGMA user_version").fetchone()[0] < ArchiveIndex.version:
+            # fills the tables added since the index is created, and moves the ends of the tasks
+            # ending after the midnight, which were stored before the midnight until version 2
+            with connection:
+                connection.execute("UPDATE tasks SET end = end + 1440 WHERE end < start")
+                connection.execute("DELETE FROM totals")
+                connection.execute("INSERT INTO totals SELECT date, name, SUM(end - start) FROM tasks "
+                                   "GROUP BY date, name")
+                connection.execute(f"PRAGMA user_version = {ArchiveIndex.version}")
+
+        return connection
+
+    @staticmethod
+    def _minutes(date, time):
+        return (time - datetime.datetime(year=date.year, month=date.month, day=date.day)) \
+            // datetime.timedelta(minutes=1)
+
+    @staticmethod
+    def rows(schedule_):
+        # rows of the tasks table for a schedule
+        date = schedule_.date.isoformat()
+        schedule_._apply_offsets()
+
+        return [(date, i, task.name, ArchiveIndex._minutes(schedule_.date, task.time_slice.start),
+                 ArchiveIndex._minutes(schedule_.date, _task_end(task)))
+                for i, task in enumerate(schedule_.task_list)]
+
+    @staticmethod
+    def _index(connection, date, rows, mtime_ns, size):
+        totals = collections.Counter()
+        for _, _, name, start, end in rows:
+            totals[name] += end - start
+
+        connection.execute("DELETE FROM tasks WHERE date = ?", (date,))
+        connection.executemany("INSERT INTO tasks VALUES (?, ?, ?, ?, ?)", rows)
+        connection.execute("DELETE FROM totals WHERE date = ?", (date,))
+        connection.executemany("INSERT INTO totals VALUES (?, ?, ?)",
+                               [(date, name, minutes) for name, minutes in totals.items()])
+        connection.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?)", (date, mtime_ns, size))
+
+    def update(self, schedule_):
+        # indexes a schedule just saved to its txt
+        stat = os.stat(schedule_.path)
+        with self._connect() as connection:
+            ArchiveIndex._index(connection, schedule_.date.isoformat(), ArchiveIndex.rows(schedule_),
+                                stat.st_mtime_ns, stat.st_size)
+        connection.close()
+
+    def import_rows(self, results):
+        # indexes the rows of many schedules in a transaction.
+        # results are (date, rows, mtime_ns, size)
+        with self._connect() as connection:
+            for date, rows, mtime_ns, size in results:
+                ArchiveIndex._index(connection, date, rows, mtime_ns, size)
+        connection.close()
+
+    def refresh(self):
+        # indexes the txts changed since they were indexed and drops the removed ones.
+        # returns the number of txts indexed again
+        with self._connect() as connection:
+            indexed = {date: (mtime_ns, size) for date, mtime_ns, size in connection.execute("SELECT * FROM files")}
+
+            count = 0
+            for entry in os.scandir(self.directory):
+                rst = date_file_pat.search(entry.name)
+                if not rst:
+                    continue
+
+                date = rst.group(1)
+                stat = entry.stat()
+                if indexed.pop(date, None) == (stat.st_mtime_ns, stat.st_size):
+                    continue
+
+                try:
+                    schedule_ = load_schedule(entry.path)
+                except ValueError as e:
+                    print(f"{err_msg}{entry.name} is not indexed: {e}")
+                    continue
+                ArchiveIndex._index(connection, date, ArchiveIndex.rows(schedule_), stat.st_mtime_ns, stat.st_size)
+                count += 1
+
+            for date in indexed:
+                connection.execute("DELETE FROM tasks WHERE date = ?", (date,))
+                connection.execute("DELETE FROM totals WHERE date = ?", (date,))
+                connection.execute("DELETE FROM files WHERE date = ?", (date,))
+        connection.close()
+
+        return count
+
+    def find(self, name=None, from_date=None, to_date=None):
+        # yields (date, task index, start, end, name) of the tasks whose names contain the name
+        sql = "SELECT date, task_index, start, end, name FROM tasks WHERE date BETWEEN ? AND ?"
+        params = [from_date or "0000-00-00", to_date or "9999-99-99"]
+        if name:
+            sql += " AND name LIKE ?"
+            params.append(f"%{name}%")
+        sql += " ORDER BY date, task_index"
+
+        connection = self._connect()
+        try:
+            yield from connection.execute(sql, params)
+        finally:
+            connection.close()
+
+    def intervals(self, from_date, to_date):
+        # {date: [(start, end)]} of the tasks between the dates, sorted by start
+        intervals = {}
+        connection = self._connect()
+        try:
+            for date, start, end in connection.execute(
+                    "SELECT date, start, end FROM tasks WHERE date BETWEEN ? AND ? ORDER BY date, start",
+                    (from_date, to_date)):
+                intervals.setdefault(date, []).append((start, end))
+        finally:
+            connection.close()
+
+        return intervals
+
+    def report(self, by="day", name=None, from_date=None, to_date=None):
+        # yields (first date of the period, task name, minutes) of the task names in every period,
+        # the longest first in a period
+        sql = f"""
+            SELECT {ArchiveIndex.periods[by]} AS period, name, SUM(minutes) AS total FROM totals
+            WHERE date BETWEEN ? AND ?{" AND name LIKE ?" if name else ""}
+            GROUP BY period, name
+            ORDER BY period, total DESC, name
+        """
+        params = [from_date or "0000-00-00", to_date or "9999-99-99"]
+        if name:
+            params.append(f"%{name}%")
+
+        connection = self._connect()
+        try:
+            yield from connection.execute(sql, params)
+        finally:
+            connection.close()
+
+    def free_days(self, start, end, from_date=None, to_date=None):
+        # yields the dates in which no task overlaps the time range [start, end) in minutes,
+        # including the tasks of the day before ending after the midnight,
+        # and the tasks of the day after if the range ends after the midnight
+        sql = """
+            SELECT date FROM files
+            WHERE date BETWEEN ? AND ?
+                AND NOT EXISTS (
+                    SELECT 1 FROM tasks
+                    WHERE tasks.date = files.date AND tasks.start < ? AND tasks.end > ?
+                )
+                AND NOT EXISTS (
+                    SELECT 1 FROM tasks
+                    WHERE tasks.date = date(files.date, '-1 day') AND tasks.end - 1440 > ?
+                )
+                AND NOT EXISTS (
+                    SELECT 1 FROM tasks
+                    WHERE tasks.date = date(files.date, '+1 day') AND tasks.start + 1440 < ?
+                )
+            ORDER BY date
+        """
+
+        connection = self._connect()
+        try:
+            for row in connection.execute(sql, (from_date or "0000-00-00", to_date or "9999-99-99", end, start,
+                                                start, end)):
+                yield row[0]
+        finally:
+            connection.close()
+
+
+def find_conflicts(task_list):
+    # yields the index pairs of the tasks whose time slices overlap but are not the same.
+    # the task list is expected to be sorted by start time
+    latest = None  # the task ending the latest so far
+    for i, task in enumerate(task_list):
+        time_slice = task.time_slice
+        if latest is not None:
+            latest_time_slice = task_list[latest].time_slice
+            if time_slice.start < latest_time_slice.start \
+                    or (time_slice.start < latest_time_slice.end and time_slice != latest_time_slice):
+                yield latest, i
+        if latest is None or time_slice.end >= task_list[latest].time_slice.end:
+            latest = i
+
+
+def _validate_txt(path):
+    # validates a schedule txt in a worker process.
+    # returns (file name, date, rows, mtime_ns, size, conflicts, error)
+    name = os.path.basename(path)
+    try:
+        stat = os.stat(path)
+        schedule_ = load_schedule(path, strict=True)
+    except (OSError, ValueError) as e:
+        return name, None, None, None, None, [], str(e)
+
+    conflicts = [(i, j, Schedule._strf_time(schedule_.task_list[i].time_slice.start),
+                  Schedule._strf_time(schedule_.task_list[j].time_slice.start))
+                 for i, j in find_conflicts(schedule_.task_list)]
+
+    return name, schedule_.date.isoformat(), ArchiveIndex.rows(schedule_), stat.st_mtime_ns, stat.st_size, \
+        conflicts, None
+
+
+def validate_archive(directory="schedule", jobs=None):
+    # parses the schedule txts in the dir in a process pool, reports parse errors and time slice conflicts,
+    # and imports the valid schedules to the archive index.
+    # returns the number of invalid txts
+    from concurrent.futures import ProcessPoolExecutor
+
+    paths = sorted(entry.path for entry in os.scandir(directory) if date_file_pat.search(entry.name))
+    jobs = jobs or os.cpu_count() or 1
+
+    begin = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        results = list(executor.map(_validate_txt, paths, chunksize=max(1, len(paths) // (jobs * 4))))
+    elapsed = time.perf_counter() - begin
+
+    errors = [(name, error) for name, _, _, _, _, _, error in results if error]
+    conflicts = [(name, conflict) for name, _, _, _, _, conflicts, _ in results for conflict in conflicts]
+    task_num = sum(len(rows) for _, _, rows, _, _, _, error in results if not error)
+
+    print(f"{len(paths)} txts, {task_num} tasks checked in {elapsed:.2f}s with {jobs} processes")
+    if errors:
+        print(f"{len(errors)} txts failed to parse:")
+        for name, error in errors:
+            print(f"  {name}: {error}")
+    if conflicts:
+        print(f"{len(conflicts)} time slice conflicts:")
+        for name, (i, j, start_i, start_j) in conflicts:
+            print(f"  {name}: ({i}) at {start_i} overlaps ({j}) at {start_j}")
+
+    ArchiveIndex(directory).import_rows((date, rows, mtime_ns, size)
+                                        for _, date, rows, mtime_ns, size, _, error in results if not error)
+
+    return len(errors) + len({name for name, _ in conflicts})
+
+
+weekday_names = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+
+
+def recurrence_weekdays(rule):
+    # weekdays (0 for monday) of a recurrence rule: daily, weekdays, weekends, or names like mon,wed,fri
+    if rule == "daily":
+        return set(range(7))
+    elif rule == "weekdays":
+        return set(range(5))
+    elif rule == "weekends":
+        return {5, 6}
+
+    weekdays = set()
+    for name in rule.split(','):
+        if name not in weekday_names:
+            raise ValueError(f"invalid recurrence rule: {rule}. "
+                             f"valid rules: daily, weekdays, weekends, or names like mon,wed,fri")
+        weekdays.add(weekday_names.index(name))
+
+    return weekdays
+
+
+def load_template(path, parser):
+    # builds a schedule from a file of add-a-task commands.
+    # only the times of the tasks are used, the date of the schedule is ignored
+    template = Schedule(date=current_schedule.get().date)
+    # the template is not displayed after every task
+    token = display_settings.set(DisplaySettings(auto=False))
+
+    try:
+        with open(path) as f:
+            for line_no, input_ in enumerate(f, start=1):
+                tokens = input_.split()
+                if not tokens or tokens[0].startswith('#'):
+                    continue
+
+                if tokens[0] not in ("add-a-task", "a"):
+                    print(f"{err_msg}line {line_no}: only add-a-task/a is allowed in a template")
+                    raise Exception
+                try:
+                    args = parser.parse_args(tokens)
+                    template.add_a_task(args.start, args.duration, args.end, args.task_name, args.rest_duration,
+                                        args.auto)
+                except (Exception, SystemExit):
+                    print(f"{err_msg}line {line_no}: {input_.strip()}")
+                    raise Exception
+    finally:
+        display_settings.reset(token)
+
+    return template
+
+
+def tasks_from_minutes(date, minutes):
+    # the tasks of (start, end, name) in minutes since the midnight of the date
+    midnight = datetime.datetime(year=date.year, month=date.month, day=date.day)
+    return [Task(TimeSlice(midnight + datetime.timedelta(minutes=start), None,
+                           midnight + datetime.timedelta(minutes=end)), name)
+            for start, end, name in minutes]
+
+
+def merge_into_day(path, date, tasks):
+    # merges the tasks sorted by start into the schedule of the txt, skipping the tasks already in it,
+    # or makes a schedule of the tasks if there is no txt.
+    # returns (the formatted schedule, whether the merged tasks conflict).
+    # the schedule is None if there is no new task or the merged tasks conflict
+    if os.path.exists(path):
+        task_list = load_schedule(path).task_list
+        existing = {(task.time_slice.start, _task_end(task), task.name) for task in task_list}
+        tasks = [task for task in tasks if (task.time_slice.start, _task_end(task), task.name) not in existing]
+        if not tasks:
+            return None, False
+        task_list = list(heapq.merge(task_list, tasks, key=lambda task: task.time_slice.start))
+    else:
+        task_list = tasks
+    if next(find_conflicts(task_list), None) is not None:
+        return None, True
+
+    schedule_ = Schedule(task_list=task_list, date=date)
+    schedule_.path = path
+    schedule_._schedule_format()
+
+    return schedule_, False
+
+
+def write_schedules(contents, rows, directory="schedule"):
+    # writes the contents of the paths at once and imports the rows of their dates into the index
+    # with the stats of the written txts, so the index does not read them again
+    atomic_write_many(contents)
+
+    results = []
+    for iso_date, date_rows in rows.items():
+        stat = os.stat(os.path.join(directory, f"{iso_date}.txt"))
+        results.append((iso_date, date_rows, stat.st_mtime_ns, stat.st_size))
+    ArchiveIndex(directory).import_rows(results)
+
+
+def generate_schedules(template, from_date, to_date, rule="daily", directory="schedule"):
+    # expands a template over the dates between from_date and to_date matching the recurrence rule.
+    # the tasks of the template are converted to minutes since midnight and formatted once,
+    # so a day without a txt just gets the same rows written.
+    # the tasks of a day with a txt are merged with the existing ones unless they conflict,
+    # skipping the tasks already in it, so running a template again over the same dates changes nothing.
+    # returns (generated dates, merged dates, conflicting dates)
+    weekdays = recurrence_weekdays(rule)
+
+    template._schedule_format()
+    template_str = template.schedule_str
+    template_minutes = [(ArchiveIndex._minutes(template.date, task.time_slice.start),
+                         ArchiveIndex._minutes(template.date, task.time_slice.end), task.name)
+                        for task in template.task_list]
+
+    contents = {}
+    rows = {}
+    generated, merged, conflicting = [], [], []
+    for day in range((to_date - from_date).days + 1):
+        date = from_date + datetime.timedelta(days=day)
+        if date.weekday() not in weekdays:
+            continue
+
+        iso_date = date.isoformat()
+        path = os.path.join(directory, f"{iso_date}.txt")
+        if not os.path.exists(path):
+            contents[path] = template_str
+            rows[iso_date] = [(iso_date, i, name, start, end) for i, (start, end, name) in enumerate(template_minutes)]
+            generated.append(iso_date)
+            continue
+
+        # merges the tasks of the template into the existing schedule
+        schedule_, conflict = merge_into_day(path, date, tasks_from_minutes(date, template_minutes))
+        if conflict:
+            conflicting.append(iso_date)
+        elif schedule_ is not None:
+            contents[path] = schedule_.schedule_str
+            rows[iso_date] = ArchiveIndex.rows(schedule_)
+            merged.append(iso_date)
+
+    write_schedules(contents, rows, directory)
+
+    return generated, merged, conflicting
+
+
+def generate_from_template(args, parser):
+    from_date = datetime.date.fromisoformat(args.from_date) if args.from_date else current_schedule.get().date
+    to_date = datetime.date.fromisoformat(args.to_date) if args.to_date else from_date
+
+    begin = time.perf_counter()
+    template = load_template(args.template, parser)
+    generated, merged, conflicting = generate_schedules(template, from_date, to_date, args.rule)
+    elapsed = time.perf_counter() - begin
+
+    print(f"{len(generated)} schedules generated, {len(merged)} merged in {elapsed:.2f}s")
+    if conflicting:
+        print(f"{err_msg}{len(conflicting)} schedules are not changed because of time slice conflicts:")
+        for date in conflicting:
+            print(f"  {date}.txt")
+
+    return len(conflicting)
+
+
+def solve_backlog(backlog, day_intervals):
+    # packs the tasks of a backlog into the free time of the days greedily.
+    # tasks of higher priorities are placed first, and tasks with earlier deadlines first among them,
+    # each at the earliest free time slice from its earliest start which ends before its deadline.
+    # backlog is [(name, duration, priority, earliest, deadline)], in minutes since the midnight of the first day.
+    # day_intervals are the sorted (start, end) of the tasks of every day in minutes since midnight.
+    # returns ({day: [(start, end, name)]}, indexes of the tasks not placed)
+    day_minutes = 24 * 60
+    gaps = [None] * len(day_intervals)
+    # longest free time slice of every day, so full days are skipped without searching
+    longest = [day_minutes] * len(day_intervals)
+    heap = [(-priority, deadline, earliest, i) for i, (_, _, priority, earliest, deadline) in enumerate(backlog)]
+    heapq.heapify(heap)
+
+    placed = {}
+    unplaced = []
+    while heap:
+        _, deadline, earliest, i = heapq.heappop(heap)
+        name, duration = backlog[i][:2]
+
+        found = False
+        for day in range(max(earliest // day_minutes, 0), min((deadline - 1) // day_minutes + 1, len(gaps))):
+            if longest[day] < duration:
+                continue
+            if gaps[day] is None:
+                gaps[day] = GapIndex(day_intervals[day], 0, day_minutes)
+                longest[day] = gaps[day].tree[1]
+
+            start = gaps[day].find(duration, max(earliest - day * day_minutes, 0))
+            if start is None:
+                continue
+            if day * day_minutes + start + duration > deadline:
+                break
+
+            gaps[day].take(start, start + duration)
+            longest[day] = gaps[day].tree[1]
+            placed.setdefault(day, []).append((start, start + duration, name))
+            found = True
+            break
+        if not found:
+            unplaced.append(i)
+
+    return placed, unplaced
+
+
+def load_backlog(path, from_date):
+    # reads a csv of tasks with the columns name, duration, priority, earliest and deadline.
+    # durations are like the ones of add-a-task, priorities are ints (0 by default) placed higher first,
+    # and earliest starts and deadlines are YYYY-MM-DD HH:MM or YYYY-MM-DD, and optional.
+    # times are converted to minutes since the midnight of from_date
+    import csv
+
+    midnight = datetime.datetime(year=from_date.year, month=from_date.month, day=from_date.day)
+
+    def minutes(value, end_of_day=False):
+        time = datetime.datetime.fromisoformat(value)
+        if end_of_day and len(value) == 10:
+            time += datetime.timedelta(days=1)
+        return (time - midnight) // datetime.timedelta(minutes=1)
+
+    backlog = []
+    with open(path, newline='') as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            try:
+                name = (row.get("name") or "").strip()
+                if not name:
+                    raise ValueError("empty name")
+                duration = ScheduleManagingArgTypeCheck.check_duration(row.get("duration") or "")
+                duration //= datetime.timedelta(minutes=1)
+                if not 0 < duration <= 24 * 60:
+                    raise ValueError("duration should be in (0, 24h]")
+                priority = int(row.get("priority") or 0)
+                earliest = minutes(row["earliest"]) if row.get("earliest") else 0
+                deadline = minutes(row["deadline"], end_of_day=True) if row.get("deadline") else sys.maxsize
+            except (ValueError, argparse.ArgumentTypeError) as e:
+                print(f"{err_msg}line {reader.line_num}: {e}")
+                raise Exception
+            backlog.append((name, duration, priority, earliest, deadline))
+
+    return backlog
+
+
+def solve_from_backlog(args, directory="schedule"):
+    # places the tasks of the backlog in the schedules between --from and --to and writes them.
+    # returns the number of tasks not placed
+    from_date = datetime.date.fromisoformat(args.from_date) if args.from_date else current_schedule.get().date
+    to_date = datetime.date.fromisoformat(args.to_date) if args.to_date else from_date
+
+    begin = time.perf_counter()
+    backlog = load_backlog(args.solve, from_date)
+
+    archive = ArchiveIndex(directory)
+    archive.refresh()
+    intervals = archive.intervals((from_date - datetime.timedelta(days=1)).isoformat(), to_date.isoformat())
+    dates = [from_date + datetime.timedelta(days=day) for day in range((to_date - from_date).days + 1)]
+    day_intervals = []
+    for date in dates:
+        # the tasks of the day before ending after the midnight take the start of the day
+        spill = max((end - 24 * 60 for _, end in intervals.get((date - datetime.timedelta(days=1)).isoformat(), [])),
+                    default=0)
+        day_intervals.append(([(0, spill)] if spill > 0 else []) + intervals.get(date.isoformat(), []))
+    placed, unplaced = solve_backlog(backlog, day_intervals)
+
+    # merges the placed tasks into the schedules of the days.
+    # a day is not written if the merged tasks conflict, which happens if the txt is changed meanwhile
+    contents = {}
+    rows = {}
+    conflicting = []
+    for day, tasks in placed.items():
+        date = dates[day]
+        path = os.path.join(directory, f"{date.isoformat()}.txt")
+        schedule_, conflict = merge_into_day(path, date, tasks_from_minutes(date, sorted(tasks)))
+        if conflict:
+            conflicting.append(day)
+        elif schedule_ is not None:
+            contents[path] = schedule_.schedule_str
+            rows[date.isoformat()] = ArchiveIndex.rows(schedule_)
+
+    write_schedules(contents, rows, directory)
+    elapsed = time.perf_counter() - begin
+
+    not_written = sum(len(placed[day]) for day in conflicting)
+    print(f"{len(backlog) - len(unplaced) - not_written} tasks placed in {len(placed) - len(conflicting)} schedules "
+          f"in {elapsed:.2f}s")
+    if unplaced:
+        print(f"{err_msg}{len(unplaced)} tasks are not placed because there is no free time slice "
+              f"between their earliest starts and deadlines:")
+        for i in sorted(unplaced):
+            name, duration = backlog[i][:2]
+            print(f"  {name} ({Schedule._strf(datetime.timedelta(minutes=duration))})")
+    if conflicting:
+        print(f"{err_msg}{len(conflicting)} schedules are not changed because of time slice conflicts:")
+        for day in conflicting:
+            print(f"  {dates[day].isoformat()}.txt")
+
+    return len(unplaced) + not_written
+
+
+def archive_tasks(directory="schedule", from_date=None, to_date=None):
+    # yields (date, task index, task, grouped) of the tasks in the schedule txts between the dates, a day at a time.
+    # grouped is True if the task has the same time slice as the task above, like the rows of the txts
+    names = sorted(entry.name for entry in os.scandir(directory) if date_file_pat.search(entry.name)
+                   and (from_date or "0000-00-00") <= entry.name[:10] <= (to_date or "9999-99-99"))
+    for name in names:
+        date = datetime.date.fromisoformat(name[:10])
+        with open(os.path.join(directory, name)) as f:
+            previous = None
+            for i, task in enumerate(parse_schedule(f, date)):
+                time_slice = (task.time_slice.start, task.time_slice.end)
+                yield date, i, task, time_slice == previous
+                previous = time_slice
+
+
+def _task_end(task):
+    # the end of a task ending at or after the midnight is on the next day
+    time_slice = task.time_slice
+    return time_slice.end + datetime.timedelta(days=1) if time_slice.end < time_slice.start else time_slice.end
+
+
+def csv_lines(tasks):
+    # yields the lines of a csv of the tasks from archive_tasks()
+    import csv
+
+    line = io.StringIO()
+    writer = csv.writer(line)
+    writer.writerow(["date", "start", "end", "duration", "name", "grouped"])
+    for date, i, task, grouped in tasks:
+        writer.writerow([date.isoformat(), Schedule._strf_time(task.time_slice.start),
+                         Schedule._strf_time(task.time_slice.end),
+                         (_task_end(task) - task.time_slice.start) // datetime.timedelta(minutes=1),
+                         task.name, 1 if grouped else 0])
+        yield line.getvalue()
+        line.seek(0)
+        line.truncate()
+
+
+def _ics_escape(text):
+    return text.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+
+def _ics_unescape(text):
+    return re.sub(r"\\(.)", lambda rst: ' ' if rst.group(1) in "nN" else rst.group(1), text)
+
+
+def _ics_fold(line):
+    # splits a line into lines of at most 75 bytes, continued by lines starting with a space
+    if len(line.encode()) <= 75:
+        return f"{line}\r\n"
+
+    lines, current, size = [], [], 0
+    for char in line:
+        char_size = len(char.encode())
+        if size + char_size > 75:
+            lines.append(''.join(current))
+            current, size = [' '], 1
+        current.append(char)
+        size += char_size
+    lines.append(''.join(current))
+
+    return "\r\n".join(lines) + "\r\n"
+
+
+def ics_lines(tasks):
+    # yields the lines of an icalendar of the tasks from archive_tasks(), with times in local time.
+    # tasks sharing the time slice of the task above are marked with X-SCHEDULE-GROUPED
+    stamp = datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    yield "BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//schedule_managing//EN\r\n"
+    for date, i, task, grouped in tasks:
+        lines = ["BEGIN:VEVENT",
+                 f"UID:{date.isoformat()}-{i}@schedule_managing",
+                 f"DTSTAMP:{stamp}",
+                 f"DTSTART:{task.time_slice.start.strftime('%Y%m%dT%H%M%S')}",
+                 f"DTEND:{_task_end(task).strftime('%Y%m%dT%H%M%S')}",
+                 f"SUMMARY:{_ics_escape(task.name)}"]
+        if grouped:
+            lines.append("X-SCHEDULE-GROUPED:TRUE")
+        lines.append("END:VEVENT")
+        yield ''.join(_ics_fold(line) for line in lines)
+    yield "END:VCALENDAR\r\n"
+
+
+def csv_records(f):
+    # yields (date, start, end, name, grouped) of the rows of a csv written by csv_lines().
+    # start and end of a grouped row may be empty
+    import csv
+
+    reader = csv.DictReader(f)
+    for row in reader:
+        try:
+            date = datetime.date.fromisoformat(row["date"])
+            midnight = datetime.datetime(year=date.year, month=date.month, day=date.day)
+            grouped = row.get("grouped", "0").strip() in ("1", "true", "TRUE")
+            if grouped and not row.get("start"):
+                start = end = None
+            else:
+                start_h, start_min = (int(n) for n in row["start"].split(':'))
+                end_h, end_min = (int(n) for n in row["end"].split(':'))
+                start = midnight.replace(hour=start_h, minute=start_min)
+                end = midnight.replace(hour=end_h, minute=end_min)
+                if end < start:
+                    end += datetime.timedelta(days=1)
+            name = row["name"].strip()
+            if not name:
+                raise ValueError("empty name")
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            raise ValueError(f"line {reader.line_num}: {e!r}")
+        yield date, start, end, name, grouped
+
+
+def _ics_time(value):
+    # YYYYMMDDTHHMMSS, seconds are dropped. strptime() is several times slower
+    if value[8] != 'T':
+        raise ValueError(f"invalid time: {value}")
+
+    return datetime.datetime(year=int(value[:4]), month=int(value[4:6]), day=int(value[6:8]),
+                             hour=int(value[9:11]), minute=int(value[11:13]))
+
+
+def ics_records(f):
+    # yields (date, start, end, name, grouped) of the events of an icalendar.
+    # times are read as local times, and events lasting whole days are skipped
+    def lines():
+        line = None
+        for raw_line in f:
+            raw_line = raw_line.rstrip("\r\n")
+            if raw_line[:1] in (' ', '\t') and line is not None:
+                line += raw_line[1:]
+                continue
+            if line is not None:
+                yield line
+            line = raw_line
+        if line is not None:
+            yield line
+
+    event = None
+    for line in lines():
+        key, _, value = line.partition(':')
+        key = key.split(';')[0].upper()
+        if key == "BEGIN" and value == "VEVENT":
+            event = {}
+        elif key == "END" and value == "VEVENT" and event is not None:
+            start, end = event.get("DTSTART", ""), event.get("DTEND", "")
+            if len(start) >= 15 and len(end) >= 15:
+                start, end = _ics_time(start), _ics_time(end)
+                yield (start.date(), start, end, _ics_unescape(event.get("SUMMARY", "")).strip() or "(no name)",
+                       event.get("X-SCHEDULE-GROUPED", "").upper() == "TRUE")
+            event = None
+        elif event is not None:
+            event[key] = value
+
+
+def import_days(records):
+    # yields (date, task list) of the records of consecutive days, sorted by start.
+    # a grouped record has the time of the record above
+    for date, day_records in itertools.groupby(records, key=lambda record: record[0]):
+        tasks = []
+        time_slice = None
+        for _, start, end, name, grouped in day_records:
+            if grouped and time_slice is not None \
+                    and (start is None or (start, end) == (time_slice.start, time_slice.end)):
+                tasks.append(Task(TimeSlice(time_slice.start, None, time_slice.end), name))
+                continue
+            if start is None:
+                raise ValueError(f"{date.isoformat()}: a grouped task without time slice is not in a group")
+            time_slice = TimeSlice(start, None, end)
+            tasks.append(Task(time_slice, name))
+        tasks.sort(key=lambda task: task.time_slice.start)
+        yield date, tasks
+
+
+def export_archive(args, directory="schedule"):
+    # writes the tasks of the saved schedules between the dates to a csv or an icalendar, a day at a time
+    if args.file.lower().endswith(".ics"):
+        lines = ics_lines
+    elif args.file.lower().endswith(".csv"):
+        lines = csv_lines
+    else:
+        print(f"{err_msg}the file should be a .ics or .csv")
         raise Exception
+
+    counter = collections.Counter()
+
+    def counted(tasks):
+        for task in tasks:
+            counter[task[0]] += 1
+            yield task
+
+    with open(args.file, 'w', newline='', encoding="utf-8") as f:
+        f.writelines(lines(counted(archive_tasks(directory, args.from_date, args.to_date))))
+    print(f"{sum(counter.values())} tasks of {len(counter)} days exported to {args.file}")
+
+
+def import_archive(args, directory="schedule", batch_size=100):
+    # writes the days of a csv or an icalendar to the schedule txts, batch_size days at a time.
+    # the tasks of a day with a txt are merged with the existing ones unless they conflict,
+    # and tasks already in the txt are not added again. a day without a txt is not written if its tasks conflict
+    if args.file.lower().endswith(".ics"):
+        records = ics_records
+    elif args.file.lower().endswith(".csv"):
+        records = csv_records
     else:
-        schedule_date_list = schedule_date.split('-')
-        year = int(schedule_date_list[0])
-        month = int(schedule_date_list[1])
-        day = int(schedule_date_list[2])
+        print(f"{err_msg}the file should be a .ics or .csv")
+        raise Exception
 
-        # creates a new schedule obj to receives the schedule being read
-        schedule = Schedule(date=datetime.date(year=year, month=month, day=day))
+    contents = {}
+    rows = {}
+    generated, merged, conflicting = [], [], []
 
-        task_str_list = schedule_str.split('\n')
+    def flush():
+        write_schedules(contents, rows, directory)
+        contents.clear()
+        rows.clear()
 
-        pat1 = re.compile(r"\((\d+?)\) (\d\d:\d\d)-(\d\d:\d\d) (\d+?)h (\d+?)min: (.+)")
-        pat2 = re.compile(r"\((\d+?)\)\s+(.+)")
-        for task_str in task_str_list:
-            rst1 = pat1.search(task_str)
-            rst2 = pat2.search(task_str)
+    with open(args.file, newline='', encoding="utf-8") as f:
+        try:
+            for date, tasks in import_days(records(f)):
+                iso_date = date.isoformat()
+                path = os.path.join(directory, f"{iso_date}.txt")
+                if path in contents or len(contents) >= batch_size:
+                    # the day is written again if it appears twice
+                    flush()
+
+                existed = os.path.exists(path)
+                schedule_, conflict = merge_into_day(path, date, tasks)
+                if conflict:
+                    conflicting.append(iso_date)
+                elif schedule_ is not None:
+                    (merged if existed else generated).append(iso_date)
+                    contents[path] = schedule_.schedule_str
+                    rows[iso_date] = ArchiveIndex.rows(schedule_)
+        except ValueError as e:
+            print(f"{err_msg}{args.file}: {e}")
+            raise Exception
+        finally:
+            flush()
+
+    print(f"{len(generated)} schedules imported, {len(merged)} merged")
+    if conflicting:
+        print(f"{err_msg}{len(conflicting)} schedules are not imported because of time slice conflicts:")
+        for date in conflicting:
+            print(f"  {date}.txt")
+
+
+def find_free_slot_in_archive(archive, duration, after, from_date, to_date):
+    # the earliest (date, start) of a free time slice of at least the duration in minutes,
+    # not earlier than after in minutes on each day.
+    # the current schedule is used instead of its txt if it is read from the txt or has tasks
+    intervals = archive.intervals(from_date.isoformat(), to_date.isoformat())
+    schedule = current_schedule.get()
+    for day in range((to_date - from_date).days + 1):
+        date = from_date + datetime.timedelta(days=day)
+        if date == schedule.date and (schedule.owns_path or schedule.task_list):
+            schedule._apply_offsets()
+            day_intervals = [(ArchiveIndex._minutes(date, task.time_slice.start),
+                              ArchiveIndex._minutes(date, task.time_slice.end)) for task in schedule.task_list]
+        else:
+            day_intervals = intervals.get(date.isoformat(), [])
 
-            if rst1:
-                start_str = rst1.group(2)
-                start_h = int(start_str.split(':')[0])
-                start_min = int(start_str.split(':')[1])
-                start = datetime.datetime(year=year, month=month, day=day, hour=start_h, minute=start_min)
+        start = GapIndex(day_intervals, 0, 24 * 60).find(duration, after)
+        if start is not None:
+            return date, start
 
-                end_str = rst1.group(3)
-                end_h = int(end_str.split(':')[0])
-                end_min = int(end_str.split(':')[1])
-                end = datetime.datetime(year=year, month=month, day=day, hour=end_h, minute=end_min)
+    return None
 
-                duration = end - start
 
-                time_slice = TimeSlice(start, duration, end)
-                task_name = rst1.group(6)
-                task = Task(time_slice, task_name)
+def query_archive(args):
+    archive = ArchiveIndex()
+    archive.refresh()
 
-                schedule.task_list.append(task)
-            elif rst2:
-                time_slice = copy.deepcopy(schedule.task_list[-1].time_slice)
-                task_name = rst2.group(2)
-                task = Task(time_slice, task_name)
+    if args.earliest:
+        if not args.duration:
+            print(f"{err_msg}argument --duration/-d is required with --earliest/-e")
+            raise Exception
 
-                schedule.task_list.append(task)
+        from_date = datetime.date.fromisoformat(args.from_date) if args.from_date else current_schedule.get().date
+        to_date = datetime.date.fromisoformat(args.to_date) if args.to_date \
+            else from_date + datetime.timedelta(days=365)
+        duration = args.duration // datetime.timedelta(minutes=1)
+        after = args.after.hour * 60 + args.after.minute if args.after else 0
 
+        found = find_free_slot_in_archive(archive, duration, after, from_date, to_date)
+        if found is None:
+            print(f"no free time slice of {Schedule._strf(args.duration)} "
+                  f"between {from_date.isoformat()} and {to_date.isoformat()}")
+        else:
+            date, start = found
+            print(f"{date.isoformat()} {str(start // 60).zfill(2)}:{str(start % 60).zfill(2)}")
+    elif args.free:
+        start = args.free.hour * 60 + args.free.minute
+        end = start + (args.duration // datetime.timedelta(minutes=1) if args.duration else 1)
+
+        dates = list(archive.free_days(start, end, args.from_date, args.to_date))
+        print('\n'.join(dates))
+        print(f"{len(dates)} days found")
+    else:
+        rows = list(archive.find(args.task_name, args.from_date, args.to_date))
+        for date, task_index, start, end, name in rows:
+            print(f"{date} ({task_index}) {str(start // 60).zfill(2)}:{str(start % 60).zfill(2)}-"
+                  f"{str(end // 60).zfill(2)}:{str(end % 60).zfill(2)}: {name}")
+        print(f"{len(rows)} tasks found")
+
+
+def report_archive(args):
+    # prints the time spent on every task name by day, week, month or year
+    archive = ArchiveIndex()
+    archive.refresh()
+
+    def strf(minutes):
+        return f"{str(minutes // 60).zfill(2)}h {str(minutes % 60).zfill(2)}min"
+
+    period, total, lines = None, 0, []
+    for row_period, name, minutes in archive.report(args.by, args.task_name, args.from_date, args.to_date):
+        if row_period != period:
+            if period is not None:
+                lines.append(f"{period} total: {strf(total)}")
+            period, total = row_period, 0
+        lines.append(f"{row_period} {strf(minutes)}: {name}")
+        total += minutes
+    if period is not None:
+        lines.append(f"{period} total: {strf(total)}")
+
+    print('\n'.join(lines))
+
+
+def run_command(parser, input_, interactive=True):
+    # runs a command line. returns True if the program should exit.
+    # in the non-interactive mode existing txts are overridden and nothing is asked on quitting
+    args = parser.parse_args(input_.split())
+
+    if args.read:
+        read_from_txt(args.read[0], override=not interactive)
+    schedule = current_schedule.get()
+    if args.save:
+        schedule.save_to_txt(override=not interactive)
+    if args.send:
+        schedule.send_to_wechat(outbox)
+    if args.display:
         schedule.display_schedule()
-        schedule.saved = True
+    if args.undo:
+        schedule.undo()
+    if args.redo:
+        schedule.redo()
+    if args.window is not None:
+        display_settings.get().window = args.window
+    if args.profile_method:
+        if profiler is None:
+            print(f"{err_msg}--profile-method needs --profile")
+            raise Exception
+        for name in args.profile_method:
+            profiler.profile_method(name)
+    if args.quit:
+        if autosaver is not None:
+            autosaver.flush()
+        if not interactive:
+            return True
+        for schedule_ in session.unsaved(schedule):
+            input_ = input(f"{os.path.basename(schedule_.path)} "
+                           "is updated but not saved. save now? (y/n)\n")
+            if input_ == 'y':
+                schedule_.save_to_txt()
+            elif input_ == 'n':
+                pass
+            else:
+                print(f"{err_msg}valid input: y, n")
+                return False
+        return True
+
+    if not any([args.read, args.save, args.send, args.display,
+                args.quit, args.undo, args.redo, args.window is not None, args.profile_method]):
+        args.func(args)
+
+    return False
 
 
 def schedule_managing(parser):
@@ -320,36 +2158,218 @@ def schedule_managing(parser):
         input_ = input()
 
         try:
-            args = parser.parse_args(input_.split())
-
-            if args.read:
-                read_from_txt(args.read[0])
-            if args.save:
-                schedule.save_to_txt()
-            if args.send:
-                schedule.send_to_wechat()
-            if args.display:
-                schedule.display_schedule()
-            if args.quit:
-                if schedule.saved is False:
-                    input_ = input(f"{os.path.basename(schedule.path)} "
-                                   "is updated but not saved. save now? (y/n)\n")
-                    if input_ == 'y':
-                        schedule.save_to_txt()
-                        break
-                    elif input_ == 'n':
-                        break
-                    else:
-                        print(f"{err_msg}valid input: y, n")
-                else:
-                    break
-
-            if not any([args.read, args.save, args.send, args.display,
-                        args.quit]):
-                args.func(args)
+            if (run_command if profiler is None else profiler.run_command)(parser, input_):
+                break
         except:
             # print(traceback.format_exc())
             pass
+        finally:
+            if autosaver is not None:
+                autosaver.notify(current_schedule.get())
+
+
+def schedule_managing_batch(parser, lines, save=False):
+    # runs the commands in the lines without displaying the schedule after every modification.
+    # the schedule is displayed, and saved if save is True, once at the end.
+    # returns the number of failed commands
+    make_dir()
+    display_settings.get().auto = False
+
+    error_num = 0
+    for line_no, input_ in enumerate(lines, start=1):
+        input_ = input_.strip()
+        if not input_ or input_.startswith('#'):
+            continue
+
+        try:
+            if (run_command if profiler is None else profiler.run_command)(parser, input_, interactive=False):
+                break
+        except SystemExit as e:
+            # raised by argparse after printing the usage and the error, or after printing the help
+            if e.code:
+                error_num += 1
+                print(f"{err_msg}line {line_no}: {input_}")
+        except Exception as e:
+            error_num += 1
+            print(f"{err_msg}line {line_no}: {input_}{f' ({type(e).__name__}: {e})' if str(e) else ''}")
+
+    schedule = current_schedule.get()
+    schedule.display_schedule()
+    # the schedules switched from are saved, as they were saved when switching in earlier versions
+    for schedule_ in session.unsaved(schedule):
+        if schedule_ is not schedule or save:
+            schedule_.save_to_txt(override=True)
+    if error_num:
+        print(f"{err_msg}{error_num} commands failed")
+
+    return error_num
+
+
+# output of the command being run for a client of the server, see ClientOutput
+client_output = contextvars.ContextVar("client_output", default=None)
+
+
+class ClientOutput:
+    # replaces sys.stdout and sys.stderr in the server,
+    # so the output of a command is sent to the client running it instead of printed
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, text):
+        output = client_output.get()
+        return (self.stream if output is None else output).write(text)
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+class ScheduleServer:
+    # serves the commands of the program to many clients over a unix socket or tcp.
+    # a client sends a command per line, and receives the output of the command followed by a line of ".".
+    # lines of the output starting with "." are sent with another "." in front.
+    # every client has its own current schedule, starting from the schedule of the date,
+    # and the schedule of a date is shared by the clients.
+    # commands run in threads, and the commands of a date are run one at a time.
+    # commands are run in the non-interactive mode, so txts are overridden and nothing is asked
+    def __init__(self, parser, date: datetime.date):
+        self.parser = parser
+        self.date = date.isoformat()
+        self.locks = {}  # date: asyncio.Lock
+        self.path = None
+
+    async def serve(self, address):
+        # address is HOST:PORT, or the path of a unix socket
+        import asyncio
+        import signal
+
+        host, _, port = address.rpartition(':')
+        if host and port.isdigit():
+            server = await asyncio.start_server(self._handle, host, int(port))
+        else:
+            if os.path.exists(address):
+                os.remove(address)
+            self.path = address
+            server = await asyncio.start_unix_server(self._handle, address)
+
+        # stops on ctrl-c or kill
+        stopped = asyncio.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            with contextlib.suppress(NotImplementedError):
+                asyncio.get_running_loop().add_signal_handler(signum, stopped.set)
+
+        sys.stdout = ClientOutput(sys.stdout)
+        sys.stderr = ClientOutput(sys.stderr)
+        print(f"serving on {address}")
+        async with server:
+            await stopped.wait()
+
+    def close(self):
+        # saves the modified schedules
+        if isinstance(sys.stdout, ClientOutput):
+            sys.stdout = sys.stdout.stream
+        if isinstance(sys.stderr, ClientOutput):
+            sys.stderr = sys.stderr.stream
+        if self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+
+        for schedule_ in session.unsaved():
+            schedule_.save_to_txt(override=True)
+
+    @staticmethod
+    def _frame(output):
+        lines = [f".{line}" if line.startswith('.') else line for line in output.splitlines()]
+        lines.append(".\n")
+
+        return '\n'.join(lines).encode()
+
+    async def _handle(self, reader, writer):
+        # runs in its own task, so the context vars set here are the client's own
+        import asyncio
+
+        output = io.StringIO()
+        client_output.set(output)
+        # the clients start with the window given to the server
+        display_settings.set(DisplaySettings(window=display_settings.get().window))
+        try:
+            current_schedule.set(await asyncio.to_thread(session.open, None, self.date, True, True))
+        except Exception:
+            writer.write(ScheduleServer._frame(output.getvalue()))
+            writer.close()
+            return
+        session.in_use[self.date] += 1
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+
+                output = io.StringIO()
+                client_output.set(output)
+                quit_ = await self._run(line.decode().strip())
+                writer.write(ScheduleServer._frame(output.getvalue()))
+                await writer.drain()
+                if quit_:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            session.in_use[current_schedule.get().date.isoformat()] -= 1
+            writer.close()
+
+    async def _run(self, input_):
+        # returns True if the client quits
+        import asyncio
+
+        if not input_ or input_.startswith('#'):
+            return False
+
+        # the command is parsed here to find the dates it uses, and parsed again while the dates are locked
+        current = current_schedule.get()
+        try:
+            args = self.parser.parse_args(input_.split())
+        except (Exception, SystemExit):
+            return False
+        dates = {current.date.isoformat()}
+        if args.read:
+            dates.add(args.read[0])
+
+        async with contextlib.AsyncExitStack() as stack:
+            # locks are taken in order, so two clients never wait for each other
+            for date in sorted(dates):
+                await stack.enter_async_context(self.locks.setdefault(date, asyncio.Lock()))
+            session.in_use.update(dates)
+            try:
+                quit_, schedule_ = await asyncio.to_thread(self._execute, input_)
+            finally:
+                session.in_use.subtract(dates)
+
+        if schedule_ is not current:
+            session.in_use[schedule_.date.isoformat()] += 1
+            session.in_use[current.date.isoformat()] -= 1
+            current_schedule.set(schedule_)
+
+        return quit_
+
+    def _execute(self, input_):
+        # runs in a thread with a copy of the context of the client.
+        # returns whether the client quits and the current schedule of the client after the command
+        try:
+            quit_ = (run_command if profiler is None else profiler.run_command)(self.parser, input_,
+                                                                                   interactive=False)
+        except SystemExit:
+            # raised by argparse after printing the usage and the error, or after printing the help
+            quit_ = False
+        except Exception as e:
+            if str(e):
+                print(f"{err_msg}{type(e).__name__}: {e}")
+            quit_ = False
+
+        schedule_ = current_schedule.get()
+        if autosaver is not None:
+            autosaver.notify(schedule_)
+
+        return quit_, schedule_
 
 
 class ScheduleManagingArgTypeCheck:
@@ -366,8 +2386,8 @@ class ScheduleManagingArgTypeCheck:
 
             hh, mm = divmod(time, 100)
             # raises ValueError if HH and MM does not satisfy the requirement of datetime.datetime()
-            time = datetime.datetime(year=schedule.date.year, month=schedule.date.month, day=schedule.date.day,
-                                     hour=hh, minute=mm)
+            date = current_schedule.get().date
+            time = datetime.datetime(year=date.year, month=date.month, day=date.day, hour=hh, minute=mm)
 
             return time
         except ValueError:
@@ -399,7 +2419,8 @@ class ScheduleManagingArgTypeCheck:
         try:
             index = int(index_input)  # raises ValueError if the index input is not int
 
-            if not (0 <= index < len(schedule.task_list)):  # if the condition is true, the index input is out of range
+            # if the condition is true, the index input is out of range
+            if not (0 <= index < len(current_schedule.get().task_list)):
                 raise IndexError
 
             return index
@@ -408,12 +2429,17 @@ class ScheduleManagingArgTypeCheck:
         except IndexError:
             raise argparse.ArgumentTypeError("index should be in [0, TASK_LIST_LEN - 1]")
 
+    date_pat = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
     @classmethod
     def check_date(cls, date_input):
-        pat = re.compile(r"^\d{4}-\d{2}-\d{2}$")
-
-        if not pat.search(date_input):
+        if not cls.date_pat.search(date_input):
             raise argparse.ArgumentTypeError("invalid date format. valid format: YYYY-MM-DD")
+        # the date should exist, such as not 2001-02-30
+        try:
+            datetime.date.fromisoformat(date_input)
+        except ValueError as e:
+            raise argparse.ArgumentTypeError(str(e))
         return date_input
 
 
@@ -427,7 +2453,7 @@ class ReadAction(argparse.Action):
             raise Exception
         elif not len(values):
             # -R
-            values = [schedule.date.strftime("%Y-%m-%d")]
+            values = [current_schedule.get().date.strftime("%Y-%m-%d")]
             setattr(namespace, self.dest, values)
         else:
             # -R date: YYYY-MM-DD
@@ -460,12 +2486,42 @@ class RestTimeAction(argparse.Action):
             setattr(namespace, self.dest, values)
 
 
-if __name__ == '__main__':
-    schedule_day = datetime.date.today() + datetime.timedelta(days=1)
-    schedule = Schedule(date=schedule_day)
+class LazySubParsersAction(argparse._SubParsersAction):
+    # builds the parser of a subcommand when it is first looked up instead of on every startup.
+    # the names are known upfront, so the usage and the choices are the same as with add_parser()
+    class ParserMap(dict):
+        # name: parser, or None until the parser is built. parsers should be got with [], which builds them
+        def __init__(self):
+            super().__init__()
+            self.builders = {}
+
+        def __getitem__(self, name):
+            parser = super().__getitem__(name)
+            if parser is None:
+                parser_class, build, kwargs, names = self.builders[name]
+                parser = parser_class(**kwargs)
+                build(parser)
+                for alias in names:
+                    self[alias] = parser
 
-    err_msg = "schedule_managing.py: error: "
+            return parser
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._name_parser_map = self.choices = LazySubParsersAction.ParserMap()
+
+    def add_lazy_parser(self, name, build, aliases=(), **kwargs):
+        # build(parser) adds the arguments of the subcommand to its parser
+        if kwargs.get("prog") is None:
+            kwargs["prog"] = f"{self._prog_prefix} {name}"
+
+        names = [name, *aliases]
+        for alias in names:
+            self._name_parser_map[alias] = None
+            self._name_parser_map.builders[alias] = (self._parser_class, build, kwargs, names)
+
+
+def build_parser():
     parser = argparse.ArgumentParser(description="schedule-managing.py - a tool for creating and managing schedules")
     parser.add_argument("--run", "-r",
                         action="store_true",
@@ -476,6 +2532,10 @@ if __name__ == '__main__':
     parser.add_argument("--today", "-t",
                         action="store_true",
                         help="create a schedule for today (for tomorrow by default)")
+    parser.add_argument("--resume", "-c",
+                        action="store_true",
+                        help="open the schedule open at the last exit instead of creating one. "
+                             "it is read from a snapshot if its txt is not changed since the exit")
     parser.add_argument("--save", "-s",
                         action="store_true",
                         help="save the schedule in a txt")
@@ -490,83 +2550,643 @@ if __name__ == '__main__':
     parser.add_argument("--display", "-p",
                         action="store_true",
                         help="displays the schedule")
-
-    subparsers = parser.add_subparsers()
+    parser.add_argument("--undo", "-z",
+                        action="store_true",
+                        help="undo the last modification of the schedule")
+    parser.add_argument("--redo", "-y",
+                        action="store_true",
+                        help="redo the last undone modification of the schedule")
+    parser.add_argument("--batch", "-b",
+                        action="store",
+                        nargs='?',
+                        const='-',
+                        help="run the commands in a file (stdin by default) without displaying the schedule "
+                             "after every command. the schedule is displayed once at the end, "
+                             "and saved if --save/-s is also given")
+    parser.add_argument("--template", "-T",
+                        action="store",
+                        help="generate schedules from a file of add-a-task commands "
+                             "for the dates between --from and --to matching --rule")
+    parser.add_argument("--rule",
+                        action="store",
+                        default="daily",
+                        help="recurrence rule of --template/-T: daily, weekdays, weekends, "
+                             "or weekday names like mon,wed,fri (daily by default)")
+    parser.add_argument("--solve",
+                        action="store",
+                        help="place the tasks of a csv with the columns "
+                             "name, duration, priority, earliest and deadline "
+                             "in the free time of the schedules between --from and --to, "
+                             "higher priorities and earlier deadlines first")
+    parser.add_argument("--from",
+                        dest="from_date",
+                        action="store",
+                        type=ScheduleManagingArgTypeCheck.check_date,
+                        help="first date of --template/-T and --solve "
+                             "(YYYY-MM-DD, the date of the schedule by default)")
+    parser.add_argument("--to",
+                        dest="to_date",
+                        action="store",
+                        type=ScheduleManagingArgTypeCheck.check_date,
+                        help="last date of --template/-T and --solve (YYYY-MM-DD, same as --from by default)")
+    parser.add_argument("--validate", "-V",
+                        action="store",
+                        nargs='?',
+                        const="schedule",
+                        help="validate the schedule txts in a dir (schedule by default) in parallel "
+                             "and import them to the archive index")
+    parser.add_argument("--jobs", "-j",
+                        action="store",
+                        type=int,
+                        help="number of processes used by --validate/-V (number of CPUs by default)")
+    parser.add_argument("--autosave", "-A",
+                        action="store",
+                        nargs='?',
+                        type=float,
+                        const=1.0,
+                        help="save the schedule in the background SECONDS after it is modified (1 by default)")
+    parser.add_argument("--transport",
+                        action="store",
+                        choices=["wechat", "local"],
+                        default="wechat",
+                        help="send the schedule to wechat file helper, "
+                             "or append it to schedule/.outbox_sent.txt for testing (wechat by default)")
+    parser.add_argument("--window", "-w",
+                        action="store",
+                        type=int,
+                        help="display N rows around the changed row after a modification "
+                             "(the whole schedule by default)")
+    parser.add_argument("--cache",
+                        action="store",
+                        type=int,
+                        default=8,
+                        help="number of schedules kept in memory when switching dates with --read/-R "
+                             "(8 by default). the least recently used modified schedules are saved when dropped")
+    parser.add_argument("--serve",
+                        action="store",
+                        help="serve the commands to many clients over a unix socket at a path, "
+                             "or over tcp at HOST:PORT. "
+                             "a client sends a command per line, and receives its output followed by a line of '.'")
+    parser.add_argument("--profile",
+                        action="store",
+                        nargs='?',
+                        const="profile.json",
+                        help="record the wall time, calls and allocated memory of the commands "
+                             "and write them to a json (profile.json by default) on exit")
+    parser.add_argument("--profile-method",
+                        action="store",
+                        nargs='+',
+                        help="profile methods of the schedule with cProfile. "
+                             "the stats are written next to the json of --profile")
+
+    subparsers = parser.add_subparsers(action=LazySubParsersAction)
 
     # parser for adding a task
-    add_a_task_parser = subparsers.add_parser(name="add-a-task",
-                                              aliases=["a"],
-                                              conflict_handler='resolve',
-                                              description="add a task to the schedule")
-    add_a_task_parser.add_argument("--start", "-s",
-                                   action="store",
-                                   type=ScheduleManagingArgTypeCheck.check_time,
-                                   help="start of the time slice")
-    add_a_task_exclusive_group = add_a_task_parser.add_mutually_exclusive_group()
-    add_a_task_exclusive_group.add_argument("--duration", "-d",
-                                            action="store",
-                                            type=ScheduleManagingArgTypeCheck.check_duration,
-                                            help="duration of the time slice")
-    add_a_task_exclusive_group.add_argument("--end", "-e",
-                                            action="store",
-                                            type=ScheduleManagingArgTypeCheck.check_time,
-                                            help="end of the time slice")
-    add_a_task_parser.add_argument("--task_name", "-t",
-                                   action=TaskAction,
-                                   nargs="+",
-                                   required=True,
-                                   help="name of the task")
-    add_a_task_parser.add_argument("--rest-duration", "-r",
-                                   action=RestTimeAction,
-                                   nargs='*',
-                                   type=ScheduleManagingArgTypeCheck.check_duration,
-                                   help="duration of a rest, 10 minutes by default")
-    add_a_task_parser.set_defaults(func=lambda args: schedule.add_a_task(
-        args.start, args.duration, args.end, args.task_name, args.rest_duration))
+    def build_add_a_task_parser(add_a_task_parser):
+        add_a_task_parser.add_argument("--start", "-s",
+                                       action="store",
+                                       type=ScheduleManagingArgTypeCheck.check_time,
+                                       help="start of the time slice")
+        add_a_task_exclusive_group = add_a_task_parser.add_mutually_exclusive_group()
+        add_a_task_exclusive_group.add_argument("--duration", "-d",
+                                                action="store",
+                                                type=ScheduleManagingArgTypeCheck.check_duration,
+                                                help="duration of the time slice")
+        add_a_task_exclusive_group.add_argument("--end", "-e",
+                                                action="store",
+                                                type=ScheduleManagingArgTypeCheck.check_time,
+                                                help="end of the time slice")
+        add_a_task_parser.add_argument("--task_name", "-t",
+                                       action=TaskAction,
+                                       nargs="+",
+                                       required=True,
+                                       help="name of the task")
+        add_a_task_parser.add_argument("--rest-duration", "-r",
+                                       action=RestTimeAction,
+                                       nargs='*',
+                                       type=ScheduleManagingArgTypeCheck.check_duration,
+                                       help="duration of a rest, 10 minutes by default")
+        add_a_task_parser.add_argument("--auto", "-a",
+                                       action="store_true",
+                                       help="place the task at the earliest free time slice after --start/-s "
+                                            "(the start of the day by default)")
+        add_a_task_parser.set_defaults(func=lambda args: current_schedule.get().add_a_task(
+            args.start, args.duration, args.end, args.task_name, args.rest_duration, args.auto))
+
+    subparsers.add_lazy_parser("add-a-task", build_add_a_task_parser,
+                               aliases=["a"],
+                               conflict_handler='resolve',
+                               description="add a task to the schedule")
 
     # parser for modifying a task
-    modify_a_task_parser = subparsers.add_parser("modify",
-                                                 aliases=["m"],
-                                                 conflict_handler='resolve')
-    modify_a_task_parser.add_argument("--task-index", "-i",
-                                      action="store",
-                                      type=ScheduleManagingArgTypeCheck.check_index,
-                                      required=True,
-                                      help="index of task to be modified")
-    modify_a_task_parser.add_argument("--start", "-s",
-                                      action="store",
-                                      type=ScheduleManagingArgTypeCheck.check_time,
-                                      help="start of the time slice")
-    modify_a_task_exclusive_group = modify_a_task_parser.add_mutually_exclusive_group()
-    modify_a_task_exclusive_group.add_argument("--duration", "-d",
-                                               action="store",
-                                               type=ScheduleManagingArgTypeCheck.check_duration,
-                                               help="duration of the time slice")
-    modify_a_task_exclusive_group.add_argument("--end", "-e",
-                                               action="store",
-                                               type=ScheduleManagingArgTypeCheck.check_time,
-                                               help="end of the time slice")
-    modify_a_task_parser.add_argument("--task_name", "-t",
-                                      action=TaskAction,
-                                      nargs='+',
-                                      help="name of the task")
-    modify_a_task_parser.set_defaults(func=lambda args: schedule.modify_a_task(
-        args.task_index, args.start, args.duration, args.end, args.task_name))
+    def build_modify_a_task_parser(modify_a_task_parser):
+        modify_a_task_parser.add_argument("--task-index", "-i",
+                                          action="store",
+                                          type=ScheduleManagingArgTypeCheck.check_index,
+                                          required=True,
+                                          help="index of task to be modified")
+        modify_a_task_parser.add_argument("--start", "-s",
+                                          action="store",
+                                          type=ScheduleManagingArgTypeCheck.check_time,
+                                          help="start of the time slice")
+        modify_a_task_exclusive_group = modify_a_task_parser.add_mutually_exclusive_group()
+        modify_a_task_exclusive_group.add_argument("--duration", "-d",
+                                                   action="store",
+                                                   type=ScheduleManagingArgTypeCheck.check_duration,
+                                                   help="duration of the time slice")
+        modify_a_task_exclusive_group.add_argument("--end", "-e",
+                                                   action="store",
+                                                   type=ScheduleManagingArgTypeCheck.check_time,
+                                                   help="end of the time slice")
+        modify_a_task_parser.add_argument("--task_name", "-t",
+                                          action=TaskAction,
+                                          nargs='+',
+                                          help="name of the task")
+        modify_a_task_parser.set_defaults(func=lambda args: current_schedule.get().modify_a_task(
+            args.task_index, args.start, args.duration, args.end, args.task_name))
+
+    subparsers.add_lazy_parser("modify", build_modify_a_task_parser,
+                               aliases=["m"],
+                               conflict_handler='resolve')
 
     # parser for deleting a task
-    delete_a_task_parser = subparsers.add_parser("delete",
-                                                 aliases=["d"])
-    delete_a_task_parser.add_argument("--task-index", "-i",
-                                      action="store",
-                                      type=ScheduleManagingArgTypeCheck.check_index,
-                                      required=True,
-                                      help="index of task to be deleted")
-    delete_a_task_parser.set_defaults(func=lambda args: schedule.delete_a_task(args.task_index))
+    def build_delete_a_task_parser(delete_a_task_parser):
+        delete_a_task_parser.add_argument("--task-index", "-i",
+                                          action="store",
+                                          type=ScheduleManagingArgTypeCheck.check_index,
+                                          required=True,
+                                          help="index of task to be deleted")
+        delete_a_task_parser.set_defaults(func=lambda args: current_schedule.get().delete_a_task(args.task_index))
+
+    subparsers.add_lazy_parser("delete", build_delete_a_task_parser,
+                               aliases=["d"])
+
+    # parser for querying the archive of schedules
+    def build_query_parser(query_parser):
+        query_parser.add_argument("--task_name", "-t",
+                                  action=TaskAction,
+                                  nargs='+',
+                                  help="find the tasks whose names contain the name")
+        query_parser.add_argument("--free", "-F",
+                                  action="store",
+                                  type=ScheduleManagingArgTypeCheck.check_time,
+                                  help="find the days in which the time slice starting at the time is free")
+        query_parser.add_argument("--duration", "-d",
+                                  action="store",
+                                  type=ScheduleManagingArgTypeCheck.check_duration,
+                                  help="duration of the free time slice")
+        query_parser.add_argument("--earliest", "-e",
+                                  action="store_true",
+                                  help="find the earliest free time slice of --duration/-d from --from/-f")
+        query_parser.add_argument("--after", "-a",
+                                  action="store",
+                                  type=ScheduleManagingArgTypeCheck.check_time,
+                                  help="earliest time of the day for --earliest/-e")
+        query_parser.add_argument("--from", "-f",
+                                  dest="from_date",
+                                  action="store",
+                                  type=ScheduleManagingArgTypeCheck.check_date,
+                                  help="first date of the query (YYYY-MM-DD)")
+        query_parser.add_argument("--to", "-u",
+                                  dest="to_date",
+                                  action="store",
+                                  type=ScheduleManagingArgTypeCheck.check_date,
+                                  help="last date of the query (YYYY-MM-DD)")
+        query_parser.set_defaults(func=query_archive)
+
+    subparsers.add_lazy_parser("query", build_query_parser,
+                               aliases=["Q"],
+                               conflict_handler='resolve',
+                               description="find tasks or free time slices in the saved schedules")
+
+    # parser for reports of the saved schedules
+    def build_report_parser(report_parser):
+        report_parser.add_argument("--by", "-b",
+                                   action="store",
+                                   choices=list(ArchiveIndex.periods),
+                                   default="day",
+                                   help="period of the report (day by default). weeks start on monday")
+        report_parser.add_argument("--task_name", "-t",
+                                   action=TaskAction,
+                                   nargs='+',
+                                   help="report the tasks whose names contain the name")
+        report_parser.add_argument("--from", "-f",
+                                   dest="from_date",
+                                   action="store",
+                                   type=ScheduleManagingArgTypeCheck.check_date,
+                                   help="first date of the report (YYYY-MM-DD)")
+        report_parser.add_argument("--to", "-u",
+                                   dest="to_date",
+                                   action="store",
+                                   type=ScheduleManagingArgTypeCheck.check_date,
+                                   help="last date of the report (YYYY-MM-DD)")
+        report_parser.set_defaults(func=report_archive)
+
+    subparsers.add_lazy_parser("report", build_report_parser,
+                               aliases=["r"],
+                               conflict_handler='resolve',
+                               description="report the time spent on every task in the saved schedules")
+
+    # parsers for exporting and importing the saved schedules
+    def build_export_parser(export_parser):
+        export_parser.add_argument("file",
+                                   help="the .ics or .csv to write")
+        export_parser.add_argument("--from", "-f",
+                                   dest="from_date",
+                                   action="store",
+                                   type=ScheduleManagingArgTypeCheck.check_date,
+                                   help="first date of the schedules (YYYY-MM-DD)")
+        export_parser.add_argument("--to", "-u",
+                                   dest="to_date",
+                                   action="store",
+                                   type=ScheduleManagingArgTypeCheck.check_date,
+                                   help="last date of the schedules (YYYY-MM-DD)")
+        export_parser.set_defaults(func=export_archive)
+
+    subparsers.add_lazy_parser("export", build_export_parser,
+                               description="write the tasks of the saved schedules to a .ics or .csv")
+
+    def build_import_parser(import_parser):
+        import_parser.add_argument("file",
+                                   help="the .ics or .csv to read")
+        import_parser.set_defaults(func=import_archive)
+
+    subparsers.add_lazy_parser("import", build_import_parser,
+                               description="write the tasks of a .ics or .csv to the schedule txts. "
+                                           "tasks are merged into existing txts unless they conflict")
+
+    return parser
+
+
+class CommandDispatcher:
+    # parses command lines with tables of the options and subcommands of an argparse parser
+    # instead of running the parser on every line.
+    # a line the tables cannot parse, including every invalid line, is parsed by the parser itself,
+    # so errors are reported the same way
+    def __init__(self, parser: argparse.ArgumentParser):
+        self.parser = parser
+        self.defaults = CommandDispatcher._defaults(parser)
+        self.options = parser._option_string_actions
+        self.subparsers = {}
+        for action in parser._actions:
+            if isinstance(action, argparse._SubParsersAction):
+                self.subparsers = action.choices
+        # tables of the subcommands, added when they are first used since their parsers are built lazily
+        self.subcommands = {}
+
+    @staticmethod
+    def _defaults(parser):
+        defaults = {action.dest: action.default for action in parser._actions
+                    if action.dest is not argparse.SUPPRESS and action.default is not argparse.SUPPRESS}
+        defaults.update(parser._defaults)
+
+        return defaults
+
+    def _subcommand(self, name):
+        # (parser, defaults) of a subcommand, None if it is not one or its lines are left to the parser.
+        # subcommands with positional arguments are left to the parser
+        if name not in self.subcommands:
+            if name not in self.subparsers:
+                return None
+            subparser = self.subparsers[name]
+            self.subcommands[name] = (subparser, CommandDispatcher._defaults(subparser)) \
+                if all(action.option_strings for action in subparser._actions) else None
+
+        return self.subcommands[name]
+
+    @staticmethod
+    def _scan(parser, options, tokens, i):
+        # splits the tokens from i into (action, option string, values) until a token which is not an option.
+        # returns None if the tokens cannot be parsed by the tables
+        calls = []
+        while i < len(tokens) and tokens[i].startswith('-'):
+            action = options.get(tokens[i])
+            if action is None or isinstance(action, argparse._HelpAction):
+                return None
+
+            option_string = tokens[i]
+            i += 1
+            j = i
+            while j < len(tokens) and not tokens[j].startswith('-'):
+                j += 1
+
+            if action.nargs == 0:
+                values = None
+            elif action.nargs is None:
+                if j == i:
+                    return None
+                values = tokens[i]
+                i += 1
+            elif action.nargs in ('*', '+', '?'):
+                if action.nargs == '+' and j == i:
+                    return None
+                if action.nargs == '?':
+                    j = min(j, i + 1)
+                values = tokens[i:j]
+                i = j
+            else:
+                return None
+            calls.append((action, option_string, values))
+
+        # checks the required and mutually exclusive arguments
+        seen = {action for action, _, _ in calls}
+        for action in parser._actions:
+            if action.required and action.option_strings and action not in seen:
+                return None
+        for group in parser._mutually_exclusive_groups:
+            if len(seen.intersection(group._group_actions)) > 1:
+                return None
+
+        return calls, i
+
+    @staticmethod
+    def _convert(action, value):
+        value = action.type(value) if action.type else value
+        if action.choices is not None and value not in action.choices:
+            raise ValueError
+
+        return value
+
+    @staticmethod
+    def _call(parser, namespace, calls):
+        for action, option_string, values in calls:
+            if action.nargs is None:
+                values = CommandDispatcher._convert(action, values)
+            elif action.nargs == '?':
+                values = CommandDispatcher._convert(action, values[0]) if values else action.const
+            elif action.nargs != 0:
+                values = [CommandDispatcher._convert(action, value) for value in values]
+            action(parser, namespace, values, option_string)
+
+    def _parse(self, tokens):
+        namespace = argparse.Namespace(**self.defaults)
+
+        scanned = CommandDispatcher._scan(self.parser, self.options, tokens, 0)
+        if scanned is None:
+            return None
+        calls, i = scanned
+
+        subparser = None
+        if i < len(tokens):
+            subcommand = self._subcommand(tokens[i])
+            if subcommand is None:
+                return None
+            subparser, defaults = subcommand
+            scanned = CommandDispatcher._scan(subparser, subparser._option_string_actions, tokens, i + 1)
+            if scanned is None or scanned[1] < len(tokens):
+                return None
+            subcalls = scanned[0]
+
+        try:
+            CommandDispatcher._call(self.parser, namespace, calls)
+            if subparser is not None:
+                subnamespace = argparse.Namespace(**defaults)
+                CommandDispatcher._call(subparser, subnamespace, subcalls)
+                for key, value in vars(subnamespace).items():
+                    setattr(namespace, key, value)
+        except (argparse.ArgumentTypeError, TypeError, ValueError):
+            return None
+
+        return namespace
+
+    def parse_args(self, args):
+        namespace = self._parse(args)
+        if namespace is None:
+            namespace = self.parser.parse_args(args)
+
+        return namespace
+
+
+class Profiler:
+    # records the wall time, the number of calls and the net allocated memory of the commands,
+    # and of the functions parsing, modifying, formatting, writing and sending schedules.
+    # the functions are wrapped only when profiling is enabled, so nothing is recorded otherwise.
+    # times of nested functions are included in the times of the outer ones
+    targets = {
+        "parse": [("CommandDispatcher", "parse_args"), (None, "parse_schedule"), (None, "load_schedule")],
+        "mutation": [("Schedule", "add_a_task"), ("Schedule", "modify_a_task"), ("Schedule", "delete_a_task"),
+                     ("Schedule", "undo"), ("Schedule", "redo")],
+        "format": [("Schedule", "_schedule_format"), ("Schedule", "display_schedule")],
+        "io": [(None, "atomic_write"), (None, "atomic_write_many"), ("Schedule", "save_to_txt"),
+               (None, "read_from_txt"), ("ArchiveIndex", "update")],
+        "send": [("Schedule", "send_to_wechat"), ("Outbox", "put")],
+    }
+    max_errors = 100
+
+    def __init__(self, path="profile.json"):
+        import tracemalloc
+
+        self.path = path
+        self.commands = {}
+        self.categories = {}
+        self.functions = {}
+        self.errors = []
+        self.cprofiles = {}
+        self.cprofiling = False
+        self.memory = tracemalloc.get_traced_memory
+        tracemalloc.start()
+
+        module = sys.modules[__name__]
+        for category, targets in Profiler.targets.items():
+            for owner, name in targets:
+                self._wrap(getattr(module, owner) if owner else module, owner, name, category)
+
+    @staticmethod
+    def _stats():
+        return {"calls": 0, "wall_time": 0.0, "allocated": 0}
+
+    @staticmethod
+    def _add(stats, elapsed, allocated):
+        stats["calls"] += 1
+        stats["wall_time"] += elapsed
+        stats["allocated"] += allocated
+
+    def _wrap(self, owner, owner_name, name, category):
+        func = getattr(owner, name)
+        function_stats = self.functions.setdefault(f"{owner_name}.{name}" if owner_name else name, Profiler._stats())
+        category_stats = self.categories.setdefault(category, Profiler._stats())
+        memory = self.memory
+
+        def wrapper(*args, **kwargs):
+            allocated = memory()[0]
+            begin = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - begin
+                allocated = memory()[0] - allocated
+                Profiler._add(function_stats, elapsed, allocated)
+                Profiler._add(category_stats, elapsed, allocated)
+
+        wrapper.__name__ = func.__name__
+        wrapper.__wrapped__ = func
+        setattr(owner, name, wrapper)
+
+    def profile_method(self, name):
+        # runs the method of the schedule with cProfile from now on
+        import cProfile
+
+        if name in self.cprofiles:
+            return
+        func = getattr(Schedule, name, None)
+        if not callable(func):
+            print(f"{err_msg}Schedule has no method {name}")
+            raise Exception
+
+        profile = self.cprofiles[name] = cProfile.Profile()
+
+        def wrapper(*args, **kwargs):
+            # only one profile can be enabled at a time
+            if self.cprofiling:
+                return func(*args, **kwargs)
+            self.cprofiling = True
+            try:
+                return profile.runcall(func, *args, **kwargs)
+            finally:
+                self.cprofiling = False
+
+        wrapper.__name__ = func.__name__
+        wrapper.__wrapped__ = func
+        setattr(Schedule, name, wrapper)
+
+    def run_command(self, parser, input_, interactive=True):
+        # runs the command with run_command and records it under its first word.
+        # errors are recorded before they are raised, since the interactive mode ignores them
+        tokens = input_.split()
+        stats = self.commands.setdefault(tokens[0] if tokens else "", Profiler._stats())
+        stats.setdefault("errors", 0)
+
+        allocated = self.memory()[0]
+        begin = time.perf_counter()
+        try:
+            return run_command(parser, input_, interactive)
+        except BaseException as e:
+            if not (isinstance(e, SystemExit) and not e.code):
+                import traceback
+
+                stats["errors"] += 1
+                if len(self.errors) < Profiler.max_errors:
+                    self.errors.append({"command": input_,
+                                        "error": repr(e),
+                                        "traceback": traceback.format_exc()})
+            raise
+        finally:
+            Profiler._add(stats, time.perf_counter() - begin, self.memory()[0] - allocated)
+
+    def dump(self):
+        # writes the report, and the stats of the profiled methods next to it
+        import tracemalloc
+
+        report = {
+            "commands": self.commands,
+            "categories": self.categories,
+            "functions": {name: stats for name, stats in self.functions.items() if stats["calls"]},
+            "peak_memory": self.memory()[1],
+            "errors": self.errors,
+            "cprofile": {},
+        }
+        for name, profile in self.cprofiles.items():
+            stats_path = f"{os.path.splitext(self.path)[0]}.{name}.prof"
+            profile.dump_stats(stats_path)
+            report["cprofile"][name] = stats_path
+        tracemalloc.stop()
+
+        atomic_write(self.path, json.dumps(report, indent=2))
+        print(f"profile written to {self.path}")
+
+
+if __name__ == '__main__':
+    schedule_day = datetime.date.today() + datetime.timedelta(days=1)
+    current_schedule.set(Schedule(date=schedule_day))
+
+    parser = build_parser()
+    dispatcher = CommandDispatcher(parser)
 
     args = parser.parse_args()
 
-    if args.run:
-        if args.today:
-            schedule.date -= datetime.timedelta(days=1)
-            schedule.set_path()
-        schedule_managing(parser)
+    if args.today:
+        schedule_day -= datetime.timedelta(days=1)
+        current_schedule.set(Schedule(date=schedule_day))
+    if args.resume:
+        make_dir()
+        resumed = load_snapshot()
+        if resumed is None:
+            print(f"{err_msg}no schedule to resume. a new schedule is created")
+        else:
+            current_schedule.set(resumed)
+            schedule_day = resumed.date
+    display_settings.get().window = args.window
+    if args.profile:
+        profiler = Profiler(args.profile)
+        for name in args.profile_method or []:
+            profiler.profile_method(name)
+    elif args.profile_method:
+        print(f"{err_msg}--profile-method needs --profile")
+        sys.exit(1)
+
+    if args.validate:
+        sys.exit(1 if validate_archive(args.validate, args.jobs) else 0)
+    if args.solve:
+        make_dir()
+        try:
+            sys.exit(1 if solve_from_backlog(args) else 0)
+        except FileNotFoundError as e:
+            print(f"{err_msg}{e}")
+        except Exception:
+            pass
+        sys.exit(1)
+    if args.template:
+        make_dir()
+        try:
+            sys.exit(1 if generate_from_template(args, dispatcher) else 0)
+        except ValueError as e:
+            print(f"{err_msg}{e}")
+        except Exception:
+            pass
+        sys.exit(1)
+
+    if args.batch or args.run or args.serve:
+        make_dir()
+        outbox = Outbox(WechatTransport() if args.transport == "wechat" else LocalTransport())
+        session = Session(args.cache)
+
+    if args.serve:
+        if args.autosave is not None:
+            autosaver = AutoSaver(args.autosave)
+        import asyncio
+
+        server = ScheduleServer(dispatcher, schedule_day)
+        try:
+            asyncio.run(server.serve(args.serve))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            # the autosaver is closed first, so it does not write the txts the server saves on closing
+            if autosaver is not None:
+                autosaver.close()
+            server.close()
+            outbox.close()
+            if profiler is not None:
+                profiler.dump()
+    elif args.batch:
+        if args.batch == '-':
+            failed = schedule_managing_batch(dispatcher, sys.stdin, save=args.save)
+        else:
+            with open(args.batch) as batch_file:
+                failed = schedule_managing_batch(dispatcher, batch_file, save=args.save)
+        outbox.close()
+        if profiler is not None:
+            profiler.dump()
+        sys.exit(1 if failed else 0)
+    elif args.run:
+        if args.autosave is not None:
+            autosaver = AutoSaver(args.autosave)
+        if args.resume and current_schedule.get().task_list:
+            current_schedule.get().display_schedule()
+        schedule_managing(dispatcher)
+        if autosaver is not None:
+            autosaver.close()
+        save_snapshot(current_schedule.get())
+        outbox.close()
+        if profiler is not None:
+            profiler.dump()